@@ -0,0 +1,69 @@
+import os
+import csv
+import sys
+import logging
+
+AIRCRAFT_CSV = '_internal/ryanair_aircrafts.csv'
+UNKNOWN_AIRCRAFT = {'model': 'NA', 'variant': 'NA'}
+
+def normalize_registration(registration):
+    """Matrícula sem hífens e em maiúsculas, como é usada no índice."""
+    return (registration or '').replace("-", "").upper()
+
+def aircraft_variant(aircraft_type):
+    """Variante usada no logbook a partir do tipo de aeronave do CSV."""
+    if '737-800' in aircraft_type:
+        return 'B737-800'
+    if 'MAX 8' in aircraft_type:
+        return 'B737-8200'
+    return 'NA'
+
+class AircraftRegistry:
+    """Frota lida do CSV das aeronaves, indexada pela matrícula normalizada.
+
+    O ficheiro só volta a ser lido quando a data de modificação muda (ver refresh).
+    """
+
+    def __init__(self, csv_file_path):
+        self.csv_file_path = csv_file_path
+        self.mtime = None
+        self.aircraft = {}
+
+    def refresh(self):
+        """Voltar a ler o CSV se tiver sido alterado desde a última leitura."""
+        mtime = os.path.getmtime(self.csv_file_path)
+        if mtime == self.mtime:
+            return
+        aircraft = {}
+        with open(self.csv_file_path, mode='r') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                aircraft[normalize_registration(row['Registration'])] = {
+                    'model': row['Aircraft Type'],
+                    'variant': aircraft_variant(row['Aircraft Type']),
+                }
+        self.aircraft = aircraft
+        self.mtime = mtime
+        logging.info(f"Frota carregada de {self.csv_file_path}: {len(aircraft)} aeronaves")
+
+    def lookup(self, registration):
+        """Modelo e variante da aeronave com a matrícula dada (com ou sem hífen)."""
+        return self.aircraft.get(normalize_registration(registration), UNKNOWN_AIRCRAFT)
+
+_registries = {}
+
+def default_aircraft_csv():
+    base_path = os.path.abspath(".")
+    if getattr(sys, 'frozen', False):
+        # Running in a bundle
+        base_path = os.path.dirname(sys.executable)
+    return os.path.join(base_path, AIRCRAFT_CSV)
+
+def get_aircraft_registry(csv_file_path=None):
+    """Registo partilhado da frota para o ficheiro dado, lido uma vez e atualizado se o ficheiro mudar."""
+    csv_file_path = os.path.abspath(csv_file_path or default_aircraft_csv())
+    registry = _registries.get(csv_file_path)
+    if registry is None:
+        registry = _registries[csv_file_path] = AircraftRegistry(csv_file_path)
+    registry.refresh()
+    return registry
@@ -1,32 +1,179 @@
+"""Atualizar a tabela de aeroportos (IATA -> ICAO e coordenadas) a partir do airports.dat do OpenFlights.
+
+O download é condicional: com o ETag e o Last-Modified guardados na atualização anterior, o
+servidor responde 304 se o ficheiro não mudou e nada é escrito. A resposta é lida em streaming,
+validada pelo número de aeroportos e só depois substitui, de forma atómica, a tabela pré-gerada
+(com um número de versão) em _internal/. Essa tabela é a única lida pelos processos, que a
+recarregam no email seguinte sem reiniciar (ex: main.py --daemon); o CSV é reescrito a seguir,
+como cópia legível. --from-csv gera a tabela a partir do CSV local, sem download.
+
+Uso: python airport_update.py [--url URL] [--base-path PASTA] [--min-airports N] [--force] [--from-csv]
+"""
+import os
 import csv
+import pickle
+import logging
+import argparse
+import sys
+from datetime import datetime, timezone
 import requests
+from atomic_file import replace_atomically
+from flights import (AIRPORTS_CSV, AIRPORTS_PICKLE, get_base_path, load_iata_to_icao_coords, read_airports_pickle,
+                     write_airports_pickle)
+
+# URL do arquivo CSV contendo dados dos aeroportos
+AIRPORTS_URL = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat'
+
+# Colunas de cada linha do airports.dat
+AIRPORT_FIELDS = 14
+
+# Uma tabela mais pequena do que isto é tratada como um download incompleto ou errado
+MIN_AIRPORTS = 5000
 
-def download_airports_data(url):
-    response = requests.get(url)
-    response.raise_for_status()  # Ensure we notice bad responses
-    return response.text
+# Redução máxima aceite face à tabela atual (sem --force)
+MAX_SHRINK = 0.1
 
-def parse_airports_data(data):
+TIMEOUT = 60
+
+def conditional_headers(artifact):
+    """Cabeçalhos If-None-Match / If-Modified-Since a partir dos metadados da tabela atual."""
+    headers = {}
+    if artifact and artifact.get('etag'):
+        headers['If-None-Match'] = artifact['etag']
+    if artifact and artifact.get('last_modified'):
+        headers['If-Modified-Since'] = artifact['last_modified']
+    return headers
+
+def parse_airports_lines(lines):
+    """Ler as linhas do airports.dat à medida que chegam. Devolve a tabela IATA -> (ICAO, latitude,
+    longitude) e o número de linhas inválidas."""
     airports = {}
-    reader = csv.reader(data.splitlines())
-    for row in reader:
-        airport_id, name, city, country, iata, icao, latitude, longitude, altitude, timezone, dst, tz, type, source = row
-        if iata and icao:
-            airports[iata] = {'icao': icao, 'latitude': float(latitude), 'longitude': float(longitude)}
-    return airports
+    invalid = 0
+    for row in csv.reader(lines):
+        if len(row) != AIRPORT_FIELDS:
+            invalid += 1
+            continue
+        iata, icao, latitude, longitude = row[4], row[5], row[6], row[7]
+        # Os valores em falta vêm como \N
+        if not iata or not icao or iata == '\\N' or icao == '\\N':
+            continue
+        try:
+            airports[iata] = (icao, float(latitude), float(longitude))
+        except ValueError:
+            invalid += 1
+    return airports, invalid
 
-# URL do arquivo CSV contendo dados dos aeroportos
-url = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat'
+def download_airports(url, artifact=None, session=None, timeout=TIMEOUT):
+    """Descarregar e ler o airports.dat, se mudou desde a tabela atual.
+
+    Devolve (tabela, linhas inválidas, metadados) ou None se o servidor respondeu 304.
+    """
+    session = session or requests.Session()
+    with session.get(url, headers=conditional_headers(artifact), stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        response.encoding = response.encoding or 'utf-8'
+        airports, invalid = parse_airports_lines(response.iter_lines(decode_unicode=True))
+        metadata = {
+            'source': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+    return airports, invalid, metadata
+
+def validate_airports(airports, invalid, previous_count=None, min_airports=MIN_AIRPORTS, force=False):
+    """Recusar tabelas com poucos aeroportos (ex: download truncado ou página de erro)."""
+    if invalid:
+        logging.warning(f"airports.dat: {invalid} linhas inválidas ignoradas")
+    if len(airports) < min_airports:
+        raise ValueError(f"Tabela de aeroportos com {len(airports)} aeroportos, abaixo do mínimo de {min_airports}")
+    if not force and previous_count and len(airports) < previous_count * (1 - MAX_SHRINK):
+        raise ValueError(f"Tabela de aeroportos passaria de {previous_count} para {len(airports)} aeroportos "
+                         f"(use --force para aceitar)")
+
+def write_airports_csv(airports, csv_file_path):
+    """Guardar a tabela no CSV lido por flights.load_iata_to_icao_coords, substituindo o ficheiro de forma atómica."""
+    with replace_atomically(csv_file_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['IATA', 'ICAO', 'Latitude', 'Longitude'])  # Cabeçalho
+        for iata, (icao, latitude, longitude) in airports.items():
+            writer.writerow([iata, icao, latitude, longitude])
+
+def current_artifact(pickle_file_path):
+    """Tabela pré-gerada atual com os seus metadados, ou None se não existir ou não puder ser lida."""
+    try:
+        return read_airports_pickle(pickle_file_path)
+    except (OSError, EOFError, ValueError, AttributeError, pickle.UnpicklingError) as e:
+        if os.path.exists(pickle_file_path):
+            logging.warning(f"Não foi possível ler a tabela de aeroportos em {pickle_file_path}: {e}")
+        return None
+
+def update_airports(url=AIRPORTS_URL, base_path=None, min_airports=MIN_AIRPORTS, force=False, session=None):
+    """Atualizar o CSV e a tabela pré-gerada em base_path/_internal se o airports.dat mudou.
+
+    Devolve um dicionário com 'updated' (False se o servidor respondeu 304), 'version' e 'airports'.
+    """
+    base_path = base_path or get_base_path()
+    csv_file_path = os.path.join(base_path, AIRPORTS_CSV)
+    pickle_file_path = os.path.join(base_path, AIRPORTS_PICKLE)
+    os.makedirs(os.path.dirname(pickle_file_path), exist_ok=True)
+
+    artifact = current_artifact(pickle_file_path)
+    result = download_airports(url, None if force else artifact, session)
+    if result is None:
+        logging.info(f"Tabela de aeroportos já atualizada (versão {artifact['version']})")
+        return {'updated': False, 'version': artifact['version'], 'airports': len(artifact['airports'])}
+
+    airports, invalid, metadata = result
+    validate_airports(airports, invalid, len(artifact['airports']) if artifact else None, min_airports, force)
+
+    version = (artifact['version'] if artifact else 0) + 1
+    # A troca do pickle é a atualização: um processo lê a tabela antiga ou a nova, nunca uma mistura
+    write_airports_pickle(airports, pickle_file_path, version,
+                          updated_at=datetime.now(timezone.utc).isoformat(), **metadata)
+    write_airports_csv(airports, csv_file_path)
+    logging.info(f"Tabela de aeroportos atualizada para a versão {version}: {len(airports)} aeroportos")
+    return {'updated': True, 'version': version, 'airports': len(airports)}
+
+def build_from_csv(base_path=None):
+    """Gerar a tabela pré-gerada a partir do CSV local (ex: numa instalação nova), com uma versão nova."""
+    base_path = base_path or get_base_path()
+    pickle_file_path = os.path.join(base_path, AIRPORTS_PICKLE)
+    airports = load_iata_to_icao_coords(os.path.join(base_path, AIRPORTS_CSV))
+    artifact = current_artifact(pickle_file_path)
+    version = (artifact['version'] if artifact else 0) + 1
+    write_airports_pickle(airports, pickle_file_path, version, source=AIRPORTS_CSV,
+                          updated_at=datetime.now(timezone.utc).isoformat())
+    logging.info(f"Tabela de aeroportos gerada a partir do CSV, versão {version}: {len(airports)} aeroportos")
+    return {'updated': True, 'version': version, 'airports': len(airports)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualizar a tabela de aeroportos a partir do airports.dat do OpenFlights")
+    parser.add_argument("--url", default=AIRPORTS_URL, help="endereço do airports.dat")
+    parser.add_argument("--base-path", help="pasta com _internal/ (por omissão, a pasta do programa)")
+    parser.add_argument("--min-airports", type=int, default=MIN_AIRPORTS, help="número mínimo de aeroportos aceite")
+    parser.add_argument("--force", action="store_true",
+                        help="descarregar mesmo sem alterações e aceitar uma tabela muito mais pequena do que a atual")
+    parser.add_argument("--from-csv", action="store_true", help="gerar a tabela a partir do CSV local, sem download")
+    args = parser.parse_args()
+
+    logging.basicConfig(filename='logbook_creator.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Fazer o download e parse dos dados dos aeroportos
-data = download_airports_data(url)
-iata_to_icao_coords = parse_airports_data(data)
+    try:
+        if args.from_csv:
+            result = build_from_csv(args.base_path)
+        else:
+            result = update_airports(args.url, args.base_path, args.min_airports, args.force)
+    except (requests.RequestException, ValueError, OSError) as e:
+        logging.error(f"Falha ao atualizar a tabela de aeroportos: {e}")
+        print(f"Falha ao atualizar a tabela de aeroportos: {e}")
+        sys.exit(1)
 
-# Salvar o dicionário em um arquivo CSV local para uso posterior
-with open('iata_to_icao_coords.csv', 'w', newline='') as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(['IATA', 'ICAO', 'Latitude', 'Longitude'])  # Cabeçalho
-    for iata, info in iata_to_icao_coords.items():
-        writer.writerow([iata, info['icao'], info['latitude'], info['longitude']])
+    if result['updated']:
+        print(f"Tabela de aeroportos atualizada para a versão {result['version']} ({result['airports']} aeroportos).")
+    else:
+        print(f"Tabela de aeroportos já atualizada (versão {result['version']}, {result['airports']} aeroportos).")
 
-print("Arquivo iata_to_icao_coords.csv criado com sucesso.")
+if __name__ == "__main__":
+    main()
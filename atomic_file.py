@@ -0,0 +1,24 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def replace_atomically(file_path, mode='wb', **kwargs):
+    """Escrever num ficheiro temporário com nome único na pasta de file_path, que substitui
+    file_path de uma só vez no fim (ou é apagado se a escrita falhar).
+
+    Usado por todos os ficheiros que o programa substitui (logbook, tabela de aeroportos, cache do
+    sol, métricas e exportações). Como o nome é único, várias execuções a escrever o mesmo ficheiro
+    ao mesmo tempo (ex: pilotos do roster) nunca partilham o ficheiro temporário. kwargs são
+    passados ao NamedTemporaryFile (ex: encoding, newline).
+    """
+    directory, name = os.path.split(os.path.abspath(file_path))
+    file = tempfile.NamedTemporaryFile(mode, prefix=f"{name}.", suffix='.tmp', dir=directory, delete=False, **kwargs)
+    try:
+        with file:
+            yield file
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, file_path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
@@ -0,0 +1,199 @@
+"""Importar para a DB os voos de emails de logbook antigos guardados em disco (.eml ou mbox).
+
+A descodificação das mensagens e o parsing correm em vários processos, cada um com as tabelas de
+aeroportos e aeronaves carregadas uma única vez. Os voos são guardados com upserts em lotes, por isso importar o mesmo arquivo
+duas vezes não cria duplicados. Depois da importação, a próxima execução do main.py exporta os
+voos novos para o logbook (use --rebuild para os ordenar).
+
+Uso: python backfill.py CAMINHO [CAMINHO ...] [--workers N] [--batch-size N] [--all-subjects] [--dry-run]
+"""
+import os
+import time
+import email
+import logging
+import argparse
+import mailbox
+from email import policy
+from email.parser import BytesHeaderParser
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from dotenv import load_dotenv
+from database import get_client, get_database, upsert_flights, close_client
+from flights import create_flight_from_email, create_flight_dicts, load_aircraft_data, get_airport_table
+from parse_cache import ParseCache, body_hash
+from rollups import refresh_rollups
+
+# Emails enviados a cada processo de uma vez, para diluir o custo da comunicação entre processos
+CHUNK_SIZE = 50
+
+# Voos acumulados antes de cada escrita em massa na DB
+BATCH_SIZE = 5000
+
+def message_body(message):
+    """Corpo do email em texto simples, ou em HTML se não houver texto simples (como em get_email_body)."""
+    part = message.get_body(preferencelist=('plain', 'html'))
+    return part.get_content() if part is not None else ""
+
+def read_message(source):
+    """Converter uma mensagem (de mbox ou ficheiro .eml) em (ID, assunto, corpo)."""
+    message = email.message_from_bytes(source, policy=policy.default)
+    body = message_body(message)
+    message_id = (message['Message-ID'] or '').strip() or body_hash(body)
+    return message_id, str(message['Subject'] or ''), body
+
+def read_message_id(source):
+    """Message-ID de uma mensagem em bruto, lendo só os cabeçalhos, ou None se não tiver."""
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(source)
+    return (headers['Message-ID'] or '').strip() or None
+
+def iter_message_sources(path):
+    """Percorrer as mensagens em bruto de um ficheiro .eml, de um mbox ou de uma pasta com ficheiros .eml."""
+    if os.path.isdir(path):
+        for directory, _, file_names in sorted(os.walk(path)):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith('.eml'):
+                    with open(os.path.join(directory, file_name), 'rb') as file:
+                        yield file.read()
+    elif path.lower().endswith('.eml'):
+        with open(path, 'rb') as file:
+            yield file.read()
+    else:
+        box = mailbox.mbox(path, create=False)
+        try:
+            for key in box.iterkeys():
+                yield box.get_bytes(key)
+        finally:
+            box.close()
+
+def iter_sources(paths):
+    """Mensagens em bruto de todos os caminhos dados."""
+    for path in paths:
+        yield from iter_message_sources(path)
+
+# Cache de emails lidos, só para consulta, em cada processo de trabalho
+_worker_cache = None
+
+def init_worker(cache_path=None):
+    """Carregar as tabelas de consulta uma vez em cada processo e abrir a cache para consulta."""
+    global _worker_cache
+    get_airport_table()
+    load_aircraft_data()
+    if cache_path:
+        _worker_cache = ParseCache(cache_path, read_only=True)
+
+def parse_messages(sources, all_subjects=False):
+    """Descodificar uma lista de mensagens em bruto e ler os voos das com o assunto "logbook" (ou de
+    todas, com all_subjects). Corre nos processos de trabalho.
+
+    Devolve (ID, corpo, voos, lidos da cache) por mensagem; os emails com o mesmo corpo de um email
+    já lido vêm da cache.
+    """
+    aircraft_data = load_aircraft_data()
+    results = []
+    for source in sources:
+        message_id, subject, body = read_message(source)
+        if not all_subjects and subject.strip().lower() != "logbook":
+            continue
+        cached = _worker_cache.get_by_body(body) if _worker_cache is not None else None
+        if cached is not None:
+            results.append((message_id, body, cached, True))
+        else:
+            results.append((message_id, body, create_flight_dicts(create_flight_from_email(body, aircraft_data) or []), False))
+    return results
+
+def parse_in_parallel(sources, workers, all_subjects=False, cache_path=None):
+    """Distribuir as mensagens em bruto pelos processos em blocos de CHUNK_SIZE e devolver os resultados à medida que chegam."""
+    chunks = iter(lambda: list(islice(sources, CHUNK_SIZE)), [])
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache_path,)) as executor:
+        pending = {executor.submit(parse_messages, chunk, all_subjects) for chunk in islice(chunks, 2 * workers)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for chunk in islice(chunks, len(done)):
+                pending.add(executor.submit(parse_messages, chunk, all_subjects))
+            for future in done:
+                yield from future.result()
+
+def backfill(paths, flights_collection=None, workers=None, batch_size=BATCH_SIZE, all_subjects=False, parse_cache=None):
+    """Importar os voos dos emails nos caminhos dados. Sem flights_collection só faz o parsing.
+
+    Devolve um dicionário com o número de mensagens e voos, o tempo e os débitos.
+    """
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    stats = {'messages': 0, 'cached': 0, 'flights': 0, 'inserted': 0, 'updated': 0, 'duplicates': 0}
+    pending_flights = []
+
+    def flush():
+        if flights_collection is not None and pending_flights:
+            counts = upsert_flights(flights_collection, pending_flights)
+            refresh_rollups(flights_collection, {flight['date'] for flight in pending_flights})
+            for key, value in counts.items():
+                stats[key] += value
+        pending_flights.clear()
+
+    def uncached(sources):
+        # Os emails já lidos noutra importação vêm da cache pelo Message-ID, sem serem descodificados;
+        # os outros são descodificados nos processos, que também procuram o corpo na cache
+        for source in sources:
+            message_id = read_message_id(source) if parse_cache is not None else None
+            cached = parse_cache.get(message_id) if message_id else None
+            if cached is None:
+                yield source
+            else:
+                stats['messages'] += 1
+                stats['cached'] += 1
+                stats['flights'] += len(cached)
+                pending_flights.extend(cached)
+
+    # Uma cache em memória não pode ser aberta pelos processos
+    cache_path = parse_cache.path if parse_cache is not None and parse_cache.path != ':memory:' else None
+    for message_id, body, flight_dicts, cached in parse_in_parallel(uncached(iter_sources(paths)), workers, all_subjects, cache_path):
+        if cached:
+            stats['cached'] += 1
+        elif parse_cache is not None:
+            parse_cache.put(message_id, body, flight_dicts)
+        stats['messages'] += 1
+        stats['flights'] += len(flight_dicts)
+        pending_flights.extend(flight_dicts)
+        if len(pending_flights) >= batch_size:
+            flush()
+            logging.info(f"Importação: {stats['messages']} emails, {stats['flights']} voos")
+    flush()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['messages_per_second'] = stats['messages'] / stats['seconds'] if stats['seconds'] else 0
+    stats['flights_per_second'] = stats['flights'] / stats['seconds'] if stats['seconds'] else 0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Importar voos de emails de logbook guardados em ficheiros .eml ou mbox")
+    parser.add_argument("paths", nargs='+', help="ficheiros .eml, ficheiros mbox ou pastas com ficheiros .eml")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="número de processos (por omissão, um por núcleo)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="voos por escrita em massa na DB")
+    parser.add_argument("--all-subjects", action="store_true", help="ler todos os emails, não só os com o assunto \"logbook\"")
+    parser.add_argument("--dry-run", action="store_true", help="só ler os emails, sem escrever na DB nem na cache")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(filename='logbook_creator.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    flights_collection = None
+    parse_cache = None
+    try:
+        if not args.dry_run:
+            flights_collection = get_database(get_client())
+            parse_cache = ParseCache(os.getenv("PARSE_CACHE_PATH") or "parse_cache.sqlite")
+
+        stats = backfill(args.paths, flights_collection, args.workers, args.batch_size, args.all_subjects, parse_cache)
+    finally:
+        if parse_cache is not None:
+            parse_cache.close()
+        close_client()
+
+    print(f"{stats['messages']} emails ({stats['cached']} da cache) e {stats['flights']} voos em {stats['seconds']:.1f}s "
+          f"com {args.workers} processos: {stats['messages_per_second']:.0f} emails/s, {stats['flights_per_second']:.0f} voos/s")
+    if flights_collection is not None:
+        print(f"DB: {stats['inserted']} inseridos, {stats['updated']} atualizados, {stats['duplicates']} duplicados")
+
+if __name__ == "__main__":
+    main()
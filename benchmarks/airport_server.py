@@ -0,0 +1,138 @@
+"""Verificar o airport_update.py contra um servidor HTTP local que serve um airports.dat de teste.
+
+O airports.dat é gerado a partir do CSV do projeto e servido com ETag, por isso os pedidos
+condicionais recebem 304. Numa pasta temporária, o script faz uma atualização, uma atualização
+sem alterações, uma série de atualizações com uma thread a ler a tabela ao mesmo tempo (nunca
+pode ver uma versão anterior, uma tabela sem ETag nem um erro) e um download truncado, que tem
+de ser recusado sem tocar na tabela.
+
+Uso: python benchmarks/airport_server.py [numero_de_atualizacoes]
+"""
+import os
+import sys
+import csv
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import flights
+from airport_update import update_airports
+from flights import AIRPORTS_CSV, AIRPORTS_PICKLE
+from synthetic import REPO_PATH
+
+def fixture(rows):
+    """airports.dat (14 colunas do OpenFlights) com os aeroportos dados e uma linha sem código IATA."""
+    lines = [f'{index},"Airport {iata}","City","Country","{iata}","{icao}",{latitude},{longitude},100,0,"E",'
+             f'"Europe/Lisbon","airport","OurAirports"' for index, (iata, icao, latitude, longitude) in enumerate(rows)]
+    lines.append('99999,"No IATA","City","Country",\\N,"ZZZZ",1,2,3,0,"E","\\N","airport","OurAirports"')
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.body
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_server(body):
+    """Servidor numa thread; o conteúdo servido muda ao alterar server.body."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.body = body
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/airports.dat"
+
+def read_continuously(stop, seen, errors):
+    """Ler a tabela como um processo em execução, até stop, guardando (versão, ETag) de cada leitura."""
+    while not stop.is_set():
+        try:
+            artifact = flights.load_airports_artifact()
+            seen.append((artifact['version'], artifact.get('etag')))
+        except Exception as e:
+            errors.append(e)
+
+def temp_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with open(os.path.join(REPO_PATH, AIRPORTS_CSV)) as file:
+        rows = list(csv.reader(file))[1:]
+
+    server, url = start_server(fixture(rows))
+    previous_path = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        internal = os.path.join(directory, '_internal')
+        os.makedirs(internal)
+        shutil.copy(os.path.join(REPO_PATH, AIRPORTS_CSV), internal)
+        pickle_path = os.path.join(directory, AIRPORTS_PICKLE)
+        # As tabelas são procuradas em _internal/ da pasta atual
+        os.chdir(directory)
+        try:
+            # Só o CSV: a tabela é a versão 0 e nenhum leitor gera o pickle
+            flights.reload_airport_table()
+            assert flights.AIRPORTS_VERSION == 0 and not os.path.exists(pickle_path)
+
+            result = update_airports(url)
+            assert result['updated'] and result['version'] == 1, result
+            result = update_airports(url)
+            assert not result['updated'] and server.requests[-1] is not None, result
+            flights.refresh_airport_table()
+            assert flights.AIRPORTS_VERSION == 1
+            print(f"atualização e 304: versão {flights.AIRPORTS_VERSION}, {len(flights.IATA_TO_ICAO_COORDS)} aeroportos")
+
+            stop, seen, errors = threading.Event(), [], []
+            reader = threading.Thread(target=read_continuously, args=(stop, seen, errors))
+            reader.start()
+            start = time.perf_counter()
+            for index in range(updates):
+                # Uma linha diferente em cada atualização muda o ETag
+                server.body = fixture(rows + [[f"Q{index:02d}"[-3:], f"QQ{index:02d}", '1.5', '2.5']])
+                assert update_airports(url)['updated']
+            elapsed = time.perf_counter() - start
+            stop.set()
+            reader.join()
+            versions = [version for version, _ in seen]
+            assert not errors, errors
+            assert versions == sorted(versions) and min(versions) >= 1, "um leitor viu uma versão anterior"
+            assert all(etag for _, etag in seen), "um leitor viu uma tabela sem ETag"
+            print(f"{updates} atualizações em {elapsed:.2f}s com {len(seen)} leituras ao mesmo tempo, "
+                  f"versões {versions[0]} a {versions[-1]}")
+
+            flights.refresh_airport_table()
+            assert flights.AIRPORTS_VERSION == updates + 1
+            version = flights.AIRPORTS_VERSION
+
+            server.body = fixture(rows[:len(rows) // 2])
+            try:
+                update_airports(url)
+            except ValueError as e:
+                print(f"download truncado recusado: {e}")
+            else:
+                raise AssertionError("download truncado aceite")
+            assert flights.load_airports_artifact()['version'] == version
+            assert not temp_files(internal), temp_files(internal)
+        finally:
+            os.chdir(previous_path)
+            server.shutdown()
+    print("ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Medir o débito da importação de arquivos de emails (backfill.py) com diferentes números de processos.
+
+Gera um mbox sintético e faz só o parsing (sem DB). Uso:
+python benchmarks/bench_backfill.py [numero_de_emails]
+"""
+import os
+import sys
+import mailbox
+import tempfile
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backfill import backfill
+from synthetic import make_logbook_emails
+
+def write_mbox(path, bodies):
+    box = mailbox.mbox(path)
+    for index, body in enumerate(bodies):
+        message = EmailMessage()
+        message['Subject'] = "Logbook"
+        message['Message-ID'] = f"<{index}@backfill.example>"
+        message.set_content(body)
+        box.add(message)
+    box.close()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "logbook.mbox")
+        write_mbox(path, make_logbook_emails(count))
+
+        workers = 1
+        while workers <= os.cpu_count():
+            stats = backfill([path], workers=workers)
+            print(f"{workers} processos: {stats['messages']} emails, {stats['flights']} voos em {stats['seconds']:.2f}s "
+                  f"({stats['messages_per_second']:.0f} emails/s, {stats['flights_per_second']:.0f} voos/s)")
+            workers *= 2
+
+if __name__ == "__main__":
+    main()
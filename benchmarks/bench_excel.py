@@ -0,0 +1,76 @@
+"""Comparar a procura de linhas livres antiga (uma leitura por voo) com o SheetAllocator,
+e o desmesclar linha a linha com o desmesclar em bloco das folhas novas.
+
+Uso: python benchmarks/bench_excel.py [numero_de_voos]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from openpyxl import load_workbook
+from aircraft_registry import get_aircraft_registry
+from excel_manager import (SheetAllocator, add_flight_to_sheet, create_new_sheet, find_next_available_row,
+                           HEADER_ROW, MAX_FLIGHTS_PER_SHEET, TEMPLATE_SHEET_NAME)
+from synthetic import make_flight_dicts, make_template_workbook
+
+def legacy_rows(wb, count):
+    """Procura antiga: voltar a ler a folha para cada voo."""
+    sheet = None
+    for candidate in wb.worksheets:
+        if candidate.title != TEMPLATE_SHEET_NAME and find_next_available_row(candidate) is not None:
+            sheet = candidate
+            break
+    if sheet is None:
+        sheet = create_new_sheet(wb)
+    for _ in range(count):
+        row = find_next_available_row(sheet)
+        if row is None:
+            sheet = create_new_sheet(wb)
+            row = find_next_available_row(sheet)
+        sheet.cell(row=row, column=2, value='x')
+
+def allocator_rows(wb, count):
+    allocator = SheetAllocator(wb)
+    for _ in range(count):
+        sheet, row = allocator.next_row()
+        sheet.cell(row=row, column=2, value='x')
+
+def legacy_write_sheet(wb, flights):
+    """Escrita antiga: procurar em todas as células mescladas da folha antes de cada linha."""
+    sheet = wb.copy_worksheet(wb[TEMPLATE_SHEET_NAME])
+    for row, flight in enumerate(flights, start=HEADER_ROW + 1):
+        for merged_cell in list(sheet.merged_cells.ranges):
+            if merged_cell.min_row == row and merged_cell.max_row == row:
+                sheet.unmerge_cells(str(merged_cell))
+        add_flight_to_sheet(sheet, row, flight, get_aircraft_registry())
+
+def write_sheet(wb, flights):
+    sheet = create_new_sheet(wb)
+    for row, flight in enumerate(flights, start=HEADER_ROW + 1):
+        add_flight_to_sheet(sheet, row, flight, get_aircraft_registry())
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = os.path.join(tmp, 'template.xlsx')
+        make_template_workbook(template_path)
+        for name, fill in (('legacy', legacy_rows), ('allocator', allocator_rows)):
+            wb = load_workbook(template_path)
+            start = time.perf_counter()
+            fill(wb, count)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10}: {count} voos em {elapsed:.2f}s ({len(wb.sheetnames) - 1} folhas)")
+
+        flights = make_flight_dicts(MAX_FLIGHTS_PER_SHEET)
+        for name, fill in (('legacy', legacy_write_sheet), ('bulk', write_sheet)):
+            wb = load_workbook(template_path)
+            start = time.perf_counter()
+            fill(wb, flights)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10}: folha completa ({len(flights)} linhas) escrita em {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    main()
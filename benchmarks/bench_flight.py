@@ -0,0 +1,119 @@
+"""Comparar a memória e o débito do Flight compacto (__slots__, minutos inteiros) com a versão antiga.
+
+Cria N voos sintéticos em cada versão e mede a memória ocupada pelos objetos e o tempo de
+construção e de serialização (to_dict e colunas). Uso:
+python benchmarks/bench_flight.py [numero_de_voos]
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flights import Flight, create_flight_dicts, create_flight_columns
+from night_time import format_minutes
+from synthetic import AIRPORTS, REGISTRATIONS
+
+MEMORY_SAMPLE = 100_000
+
+class LegacyFlight:
+    """Flight antes desta alteração: atributos num __dict__, tempos em texto e strptime no __init__."""
+
+    def __init__(self, date, departure_airport, arrival_airport, departure_time, arrival_time, aircraft_registration, aircraft_type, flight_time, captain, takeoffs_day, takeoffs_night, landings_day, landings_night, night_flight_time, ifr_time):
+        self.date = date
+        self.departure_airport = departure_airport
+        self.arrival_airport = arrival_airport
+        self.departure_time = departure_time
+        self.arrival_time = arrival_time
+        self.aircraft_registration = aircraft_registration
+        self.aircraft_type = aircraft_type
+        self.flight_time = flight_time
+        self.captain = captain
+        self.takeoffs_day = takeoffs_day
+        self.takeoffs_night = takeoffs_night
+        self.landings_day = landings_day
+        self.landings_night = landings_night
+        self.night_flight_time = night_flight_time
+        self.ifr_time = ifr_time
+        self.datetime = datetime.strptime(f"{self.date} {self.departure_time}", '%Y/%m/%d %H:%M')
+
+    def to_dict(self):
+        return {
+            'date': self.date,
+            'departure_airport': self.departure_airport,
+            'arrival_airport': self.arrival_airport,
+            'departure_time': self.departure_time,
+            'arrival_time': self.arrival_time,
+            'aircraft_registration': self.aircraft_registration,
+            'aircraft_type': self.aircraft_type,
+            'flight_time': self.flight_time,
+            'captain': self.captain,
+            'takeoffs_day': self.takeoffs_day,
+            'takeoffs_night': self.takeoffs_night,
+            'landings_day': self.landings_day,
+            'landings_night': self.landings_night,
+            'night_flight_time': self.night_flight_time,
+            'ifr_time': self.ifr_time,
+            'datetime': self.datetime
+        }
+
+def make_sections(count, seed=0):
+    """Valores de cada voo tal como o parser os obtém do email: datas e horas em texto."""
+    rng = random.Random(seed)
+    current = datetime(2015, 1, 1)
+    for _ in range(count):
+        current += timedelta(minutes=rng.randint(90, 600))
+        duration = rng.randint(45, 240)
+        night = rng.randint(0, duration)
+        yield (current.strftime('%Y/%m/%d'), current.strftime('%H:%M'),
+               (current + timedelta(minutes=duration)).strftime('%H:%M'),
+               current, duration, night, rng.sample(AIRPORTS, 2), rng.choice(REGISTRATIONS))
+
+def build_legacy(sections):
+    return [LegacyFlight(date, departure, arrival, departure_time, arrival_time, registration, 'Boeing 737-800',
+                         format_minutes(duration), 'JOHN DOE', 1, 0, 1, 0, format_minutes(night),
+                         str(timedelta(minutes=duration))[:-3])
+            for date, departure_time, arrival_time, _, duration, night, (departure, arrival), registration in sections]
+
+def build_compact(sections):
+    return [Flight(date, departure, arrival, departure_time, arrival_time, registration, 'Boeing 737-800',
+                   duration, 'JOHN DOE', 1, 0, 1, 0, night, duration, takeoff)
+            for date, departure_time, arrival_time, takeoff, duration, night, (departure, arrival), registration in sections]
+
+def measure(name, build, sections, count):
+    # A memória é medida numa amostra, porque o tracemalloc torna a construção muito mais lenta
+    sample = sections[:MEMORY_SAMPLE]
+    tracemalloc.start()
+    flights = build(sample)
+    size = tracemalloc.get_traced_memory()[0] / len(sample) * count
+    tracemalloc.stop()
+    del flights
+
+    start = time.perf_counter()
+    flights = build(sections)
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_flight_dicts(flights)
+    serialized = time.perf_counter() - start
+
+    print(f"{name}: {size / count:.0f} bytes/voo ({size / 2**20:.0f} MB), "
+          f"construção {count / built:,.0f} voos/s, to_dict {count / serialized:,.0f} voos/s")
+    return flights
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sections = list(make_sections(count))
+
+    measure("Antigo", build_legacy, sections, count)
+    flights = measure("Compacto", build_compact, sections, count)
+
+    start = time.perf_counter()
+    create_flight_columns(flights)
+    print(f"Compacto em colunas: {count / (time.perf_counter() - start):,.0f} voos/s")
+
+if __name__ == "__main__":
+    main()
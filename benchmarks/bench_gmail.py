@@ -0,0 +1,35 @@
+"""Medir as idas e voltas à API do Gmail para listar e filtrar os emails de logbook.
+
+Usa o serviço Gmail falso com latência simulada. Uso:
+python benchmarks/bench_gmail.py [numero_de_emails] [latencia_em_segundos]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_connect import LOGBOOK_QUERY, fetch_emails, filter_logbook_emails, get_email_subjects
+from fake_gmail import FakeGmailService
+from synthetic import make_logbook_emails
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    service = FakeGmailService(latency=latency)
+    for index, body in enumerate(make_logbook_emails(count)):
+        service.add_message("Logbook" if index % 2 == 0 else "Newsletter", body)
+
+    start = time.perf_counter()
+    email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
+    subjects = get_email_subjects(service, email_ids)
+    logbook_email_ids = filter_logbook_emails(service, email_ids, subjects)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(logbook_email_ids)} emails de logbook em {count} emails: "
+          f"{service.round_trips} idas e voltas, {elapsed:.2f}s "
+          f"(antes: {1 + 2 * count} idas e voltas com downloads completos)")
+
+if __name__ == "__main__":
+    main()
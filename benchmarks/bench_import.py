@@ -0,0 +1,51 @@
+"""Medir o tempo de importação do parser (import flights) num processo novo.
+
+O flights é importado por todos os scripts (main.py, backfill.py, export.py, workers do backfill),
+por isso não pode carregar o NumPy nem o pymongo: o NumPy só é importado nos cálculos vetorizados
+e o pymongo só pelo código da DB. Cada medição corre num interpretador novo; o script falha se
+algum desses módulos for carregado ou se a mediana passar do limite. Uso:
+python benchmarks/bench_import.py [repeticoes] [limite_ms]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import REPO_PATH
+
+# Módulos pesados que o parser não pode arrastar na importação
+HEAVY_MODULES = ('numpy', 'pymongo', 'openpyxl')
+
+MEASURE = """
+import sys, json, time
+start = time.perf_counter()
+import flights
+elapsed = time.perf_counter() - start
+print(json.dumps({'ms': elapsed * 1000, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+def measure_once():
+    output = subprocess.run([sys.executable, '-c', MEASURE], cwd=REPO_PATH, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    limit_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+
+    results = [measure_once() for _ in range(repeats)]
+    loaded = sorted({name for result in results for name in result['loaded']})
+    times = [result['ms'] for result in results]
+    median = statistics.median(times)
+    print(f"import flights: mediana {median:.1f} ms, mínimo {min(times):.1f} ms, máximo {max(times):.1f} ms "
+          f"({repeats} processos)")
+
+    assert not loaded, f"import flights carregou {', '.join(loaded)}"
+    assert median <= limit_ms, f"import flights demorou {median:.1f} ms (limite {limit_ms:.0f} ms)"
+    print("ok")
+
+if __name__ == "__main__":
+    main()
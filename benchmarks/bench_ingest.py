@@ -0,0 +1,50 @@
+"""Comparar o download sequencial dos corpos dos emails com o pipeline paralelo do email_connect.
+
+Usa o serviço Gmail falso com latência simulada. Uso:
+python benchmarks/bench_ingest.py [numero_de_emails] [latencia_em_segundos] [threads]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_connect import LOGBOOK_QUERY, fetch_emails, get_email_body, stream_email_bodies
+from fake_gmail import FakeGmailService
+from flights import create_flight_from_email, load_aircraft_data
+from synthetic import make_logbook_emails
+
+def ingest(bodies, aircraft_data):
+    flights = 0
+    for _, body in bodies:
+        flights += len(create_flight_from_email(body, aircraft_data) or [])
+    return flights
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    service = FakeGmailService(latency=latency)
+    for body in make_logbook_emails(count):
+        service.add_message("Logbook", body)
+    aircraft_data = load_aircraft_data()
+
+    start = time.perf_counter()
+    email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
+    listing = time.perf_counter() - start
+    print(f"Listagem: {len(email_ids)} emails em {listing:.2f}s ({service.round_trips} páginas)")
+
+    start = time.perf_counter()
+    flights = ingest(((email_id['id'], get_email_body(service, email_id['id'])) for email_id in email_ids), aircraft_data)
+    sequential = time.perf_counter() - start
+    print(f"Sequencial: {flights} voos em {sequential:.2f}s ({len(email_ids) / sequential:.0f} emails/s)")
+
+    start = time.perf_counter()
+    flights = ingest(stream_email_bodies(lambda: service, email_ids, max_workers=workers), aircraft_data)
+    parallel = time.perf_counter() - start
+    print(f"Paralelo ({workers} threads): {flights} voos em {parallel:.2f}s "
+          f"({len(email_ids) / parallel:.0f} emails/s, {sequential / parallel:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Medir o parser de emails de logbook sobre um corpus sintético.
+
+Compara a extração antiga (re.split + uma procura por campo) com parse_flight_sections,
+e mede o create_flight_from_email completo. Uma parte dos sectores tem campos em branco.
+
+Uso: python benchmarks/bench_parser.py [numero_de_emails]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flights import create_flight_from_email, load_aircraft_data, parse_flight_sections
+from synthetic import make_logbook_emails
+
+# Fração dos sectores do corpus com um campo em branco
+BLANK_RATE = 0.05
+
+LEGACY_FIELDS = {
+    'city_pair': r'City Pair\s+:\s+(\w+ - \w+)',
+    'airborne': r'Airborne\s+:\s+(\d{2}:\d{2})',
+    'landed': r'Landed\s+:\s+(\d{2}:\d{2})',
+    'registration': r'Registration\s+:\s+(\w+)',
+    'total_flight': r'Total flight\s+:\s+(\d{2}:\d{2})',
+    'takeoffs_day': r'Take Offs Day\s+:\s+(\d+)',
+    'takeoffs_night': r'Take Offs Night\s+:\s+(\d+)',
+    'landings_day': r'Landings Day\s+:\s+(\d+)',
+    'landings_night': r'Landings Night\s+:\s+(\d+)',
+    'night_flight_time': r'Night Flight Time\s+:\s+(\d{2}:\d{2})',
+    'ifr_time': r'IFR Time\s+:\s+(\d{2}:\d{2})',
+}
+
+def legacy_sections(email_body):
+    """Extração antiga, secção a secção e campo a campo.
+
+    O \\s+ do padrão antigo atravessa linhas: num campo em branco o valor era o nome do campo
+    seguinte (ex: 'Registration : ' dava 'Airborne'). Esses valores ficam de fora, como no parser atual.
+    """
+    sections = re.split(r'(FlightNumber\s+:\s+\w+)', email_body)[1:]
+    sections = [''.join(sections[i:i+2]) for i in range(0, len(sections), 2)]
+    result = []
+    for section in sections:
+        fields = {}
+        for field, pattern in LEGACY_FIELDS.items():
+            match = re.search(pattern, section)
+            if match and '\n' not in match.group(0):
+                fields[field] = match.group(1)
+        result.append(fields)
+    return result
+
+def timed(label, function, emails):
+    start = time.perf_counter()
+    results = [function(email) for email in emails]
+    elapsed = time.perf_counter() - start
+    print(f"{label:>22}: {len(emails) / elapsed:10.0f} emails/s")
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    emails = make_logbook_emails(count, blank_rate=BLANK_RATE)
+    aircraft_data = load_aircraft_data()
+
+    legacy = timed('legacy sections', legacy_sections, emails)
+    single_pass = timed('parse_flight_sections', parse_flight_sections, emails)
+    for old, new in zip(legacy, single_pass):
+        assert old == [{key: value for key, value in fields.items() if key != 'flight_number'} for fields in new]
+
+    flights = timed('create_flight_from_email', lambda email: create_flight_from_email(email, aircraft_data), emails)
+    # Nenhuma secção completa se perde por causa de um campo em branco
+    for old, email_flights in zip(legacy, flights):
+        assert len(email_flights) == sum(1 for fields in old if {'city_pair', 'airborne', 'landed'} <= fields.keys())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Serviço Gmail falso, em memória, com latência configurável por ida e volta à API.
+
+Imita a parte da API usada pelo email_connect: messages().list/get/trash/batchModify,
+history().list, getProfile e pedidos batch. fail_message simula falhas de mensagens individuais.
+"""
+import base64
+import threading
+import time
+import httplib2
+from googleapiclient.errors import HttpError
+
+class FakeRequest:
+    def __init__(self, service, handler):
+        self.service = service
+        self.handler = handler
+
+    def execute(self):
+        self.service.round_trip()
+        return self.handler()
+
+class FakeBatch:
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request, callback or self.callback, request_id or str(len(self.requests))))
+
+    def execute(self):
+        # Um pedido batch é uma única ida e volta, independentemente do número de pedidos
+        self.service.round_trip()
+        for request, callback, request_id in self.requests:
+            try:
+                response, exception = request.handler(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+class FakeMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId='me', labelIds=None, q=None, pageToken=None, maxResults=100):
+        def handler():
+            ids = self.service.matching_ids(labelIds, q)
+            start = int(pageToken or 0)
+            page = ids[start:start + maxResults]
+            result = {'messages': [{'id': message_id, 'threadId': message_id} for message_id in page],
+                      'resultSizeEstimate': len(ids)}
+            if start + maxResults < len(ids):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return FakeRequest(self.service, handler)
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None):
+        def handler():
+            self.service.check_failure(id)
+            message = self.service.messages[id]
+            if format == 'metadata':
+                headers = [{'name': 'Subject', 'value': message['subject']}]
+                return {'id': id, 'labelIds': sorted(message['labels']), 'payload': {'headers': headers}}
+            data = base64.urlsafe_b64encode(message['body'].encode('utf-8')).decode('ascii')
+            return {'id': id, 'labelIds': sorted(message['labels']), 'payload': {
+                'mimeType': 'multipart/alternative',
+                'headers': [{'name': 'Subject', 'value': message['subject']}],
+                'parts': [{'mimeType': 'text/plain', 'body': {'data': data}}],
+            }}
+        return FakeRequest(self.service, handler)
+
+    def trash(self, userId='me', id=None):
+        def handler():
+            self.service.messages[id]['labels'] = {'TRASH'}
+            return {'id': id}
+        return FakeRequest(self.service, handler)
+
+    def batchModify(self, userId='me', body=None):
+        def handler():
+            if len(body['ids']) > 1000:
+                raise ValueError("batchModify aceita no máximo 1000 IDs")
+            for message_id in body['ids']:
+                labels = self.service.messages[message_id]['labels']
+                labels |= set(body.get('addLabelIds', []))
+                labels -= set(body.get('removeLabelIds', []))
+            return ''
+        return FakeRequest(self.service, handler)
+
+class FakeHistory:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, labelId=None, pageToken=None, maxResults=100):
+        def handler():
+            records = [{'id': str(history_id), 'messagesAdded': [{'message': {
+                           'id': message_id, 'threadId': message_id, 'labelIds': sorted(labels)}}]}
+                       for history_id, message_id, labels in self.service.history
+                       if history_id > int(startHistoryId) and (labelId is None or labelId in labels)]
+            start = int(pageToken or 0)
+            result = {'history': records[start:start + maxResults], 'historyId': str(self.service.history_id)}
+            if start + maxResults < len(records):
+                result['nextPageToken'] = str(start + maxResults)
+            return result
+        return FakeRequest(self.service, handler)
+
+class FakeUsers:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return FakeMessages(self.service)
+
+    def history(self):
+        return FakeHistory(self.service)
+
+    def getProfile(self, userId='me'):
+        return FakeRequest(self.service, lambda: {'emailAddress': 'me@example.com', 'historyId': str(self.service.history_id)})
+
+class FakeGmailService:
+    """Caixa de correio em memória. latency é o tempo (segundos) de cada ida e volta à API."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = {}
+        self.round_trips = 0
+        self.history_id = 1000
+        self.history = []
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def add_message(self, subject, body, labels=('INBOX',)):
+        with self.lock:
+            message_id = f"{len(self.messages) + 1:016x}"
+            self.messages[message_id] = {'subject': subject, 'body': body, 'labels': set(labels)}
+            self.history_id += 1
+            self.history.append((self.history_id, message_id, set(labels)))
+        return message_id
+
+    def fail_message(self, message_id, times=1, status=429):
+        """Fazer os próximos times pedidos messages().get desta mensagem falharem com o status HTTP dado."""
+        self.failures[message_id] = (times, status)
+
+    def check_failure(self, message_id):
+        with self.lock:
+            times, status = self.failures.get(message_id, (0, None))
+            if not times:
+                return
+            self.failures[message_id] = (times - 1, status)
+        raise HttpError(httplib2.Response({'status': status}), b'{"error": {"message": "injected failure"}}')
+
+    def matching_ids(self, label_ids, query):
+        # Suporta apenas pesquisas 'subject:palavra', como a usada pelo email_connect
+        word = query.split(':', 1)[1].lower() if query and query.startswith('subject:') else None
+        return [message_id for message_id, message in self.messages.items()
+                if (not label_ids or set(label_ids) <= message['labels'])
+                and (word is None or word in message['subject'].lower().split())]
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def users(self):
+        return FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
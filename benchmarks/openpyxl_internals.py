@@ -0,0 +1,146 @@
+"""Verificar as partes internas do openpyxl de que o excel_manager depende.
+
+O requirements.txt fixa o openpyxl na série 3.1. Antes de mudar de versão, correr este script:
+falha se alguma das partes internas usadas deixar de se comportar como o excel_manager espera.
+
+    clear_data_merges      apaga as células mescladas de Worksheet._cells (o unmerge_cells procura
+                           cada intervalo em todos os outros, o que é quadrático nas 1500 linhas)
+    TemplateStyles         usa o _style das células (StyleArray) como chave e para copiar estilos
+    load_logbook_template  troca o XML das outras folhas por folhas vazias e mantém as suas
+                           relações; verificado com uma folha de voos com comentários e um gráfico
+
+Uso: python benchmarks/openpyxl_internals.py
+"""
+import os
+import sys
+import tempfile
+from copy import copy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import openpyxl
+from openpyxl import load_workbook
+from openpyxl.cell import MergedCell
+from openpyxl.chart import BarChart, Reference
+from openpyxl.comments import Comment
+from excel_manager import (HEADER_ROW, MAX_FLIGHTS_PER_SHEET, TEMPLATE_SHEET_NAME, TemplateStyles, clear_data_merges,
+                           copy_print_settings, load_aircraft_data, load_logbook_template, write_logbook,
+                           write_template_page)
+from aircraft_registry import AIRCRAFT_CSV
+from synthetic import REPO_PATH, make_flight_dicts, make_template_workbook
+
+def check_version():
+    major, minor = (int(part) for part in openpyxl.__version__.split('.')[:2])
+    assert (major, minor) == (3, 1), f"openpyxl {openpyxl.__version__}: as verificações abaixo são para a 3.1"
+    print(f"openpyxl {openpyxl.__version__}")
+
+def check_clear_data_merges(template_path):
+    fast = load_workbook(template_path)['Sheet0']
+    public = load_workbook(template_path)['Sheet0']
+    rows = {HEADER_ROW + 1, HEADER_ROW + 10}
+
+    clear_data_merges(fast, rows)
+    for merged_range in [merged_range for merged_range in public.merged_cells.ranges if merged_range.min_row in rows]:
+        public.unmerge_cells(merged_range.coord)
+
+    # O mesmo resultado que o unmerge_cells: os mesmos intervalos e as mesmas células
+    assert {str(merged_range) for merged_range in fast.merged_cells.ranges} == \
+        {str(merged_range) for merged_range in public.merged_cells.ranges}
+    assert set(fast._cells) == set(public._cells)
+    for row in rows:
+        cell = fast.cell(row=row, column=10)
+        assert not isinstance(cell, MergedCell), f"J{row} continua mesclada"
+        cell.value = "x"
+
+    clear_data_merges(fast)
+    data_merges = [merged_range for merged_range in fast.merged_cells.ranges
+                   if HEADER_ROW < merged_range.min_row <= HEADER_ROW + MAX_FLIGHTS_PER_SHEET]
+    assert not data_merges, data_merges
+    print("clear_data_merges: ok")
+
+def check_copy_print_settings():
+    wb = openpyxl.Workbook()
+    source = wb.active
+    source.page_setup.orientation = 'landscape'
+    source.page_setup.fitToHeight = 0
+    source.sheet_properties.pageSetUpPr.fitToPage = True
+    source.print_title_rows = '1:2'
+    source.print_area = 'A1:U1503'
+    target = wb.create_sheet('Sheet1')
+    copy_print_settings(source, target)
+
+    # O ajustar à página tem de ser lido das propriedades da própria folha
+    target.sheet_properties.pageSetUpPr.fitToPage = False
+    assert source.page_setup.fitToPage and not target.page_setup.fitToPage
+    assert target.page_setup.orientation == 'landscape' and target.page_setup.fitToHeight == 0
+    assert target.print_title_rows == '$1:$2' and target.print_area == "'Sheet1'!$A$1:$U$1503"
+    print("copy_print_settings: ok")
+
+def check_template_styles(template_path, directory):
+    template_sheet = load_workbook(template_path)[TEMPLATE_SHEET_NAME]
+    styles = TemplateStyles()
+    wb = openpyxl.Workbook(write_only=True)
+    write_template_page(wb.create_sheet(TEMPLATE_SHEET_NAME), template_sheet, styles)
+    path = os.path.join(directory, 'styles.xlsx')
+    wb.save(path)
+
+    # Cada estilo distinto é traduzido uma vez e as células seguintes reutilizam-no
+    assert len(styles.cache) < 10, len(styles.cache)
+    copied = load_workbook(path)[TEMPLATE_SHEET_NAME]
+    for coordinate in ('B2', 'M2', 'B3', 'U3', f'B{HEADER_ROW + MAX_FLIGHTS_PER_SHEET}'):
+        source, target = template_sheet[coordinate], copied[coordinate]
+        for attribute in ('font', 'border', 'fill', 'alignment', 'protection'):
+            # Os estilos das células são proxies; as cópias comparam-se pelo valor
+            assert copy(getattr(target, attribute)) == copy(getattr(source, attribute)), (coordinate, attribute)
+        assert target.number_format == source.number_format, coordinate
+    print("TemplateStyles: ok")
+
+def make_logbook_with_extras(template_path, path):
+    """Logbook com a folha template alterada pelo piloto e uma folha de voos com comentários e um gráfico."""
+    wb = load_workbook(template_path)
+    template_sheet = wb[TEMPLATE_SHEET_NAME]
+    template_sheet['B1'] = "MY LOGBOOK"
+    template_sheet.print_title_rows = '1:2'
+    flights_sheet = wb.copy_worksheet(template_sheet)
+    flights_sheet.title = "Sheet1"
+    for row in range(HEADER_ROW + 1, HEADER_ROW + 6):
+        flights_sheet.cell(row=row, column=2, value=f"2024/01/0{row - HEADER_ROW}")
+        flights_sheet.cell(row=row, column=14, value=1)
+    flights_sheet['B3'].comment = Comment("voo de largada", "piloto")
+    flights_sheet['N4'].comment = Comment("descolagem noturna?", "piloto")
+    chart = BarChart()
+    chart.add_data(Reference(flights_sheet, min_col=14, min_row=HEADER_ROW + 1, max_row=HEADER_ROW + 5))
+    flights_sheet.add_chart(chart, "W3")
+    wb.save(path)
+
+def check_logbook_template(template_path, directory):
+    path = os.path.join(directory, 'logbook.xlsx')
+    make_logbook_with_extras(template_path, path)
+
+    template_sheet = load_logbook_template(path)
+    assert template_sheet.title == TEMPLATE_SHEET_NAME and template_sheet['B1'].value == "MY LOGBOOK"
+    assert template_sheet.print_title_rows == '$1:$2'
+    assert not template_sheet._charts and not any(cell.comment for row in template_sheet.iter_rows() for cell in row)
+
+    # A reorganização usa a folha template do próprio logbook, mesmo com as outras partes presentes
+    aircraft_data = load_aircraft_data(os.path.join(REPO_PATH, AIRCRAFT_CSV))
+    write_logbook(path, make_flight_dicts(10), aircraft_data, template_path=template_path)
+    wb = load_workbook(path)
+    assert wb.sheetnames == [TEMPLATE_SHEET_NAME, 'Sheet1'], wb.sheetnames
+    assert wb[TEMPLATE_SHEET_NAME]['B1'].value == "MY LOGBOOK" and wb['Sheet1']['B1'].value == "MY LOGBOOK"
+    assert wb['Sheet1'].cell(row=HEADER_ROW + 1, column=2).value == '2015/01/01'
+    print("load_logbook_template: ok")
+
+def main():
+    check_version()
+    with tempfile.TemporaryDirectory() as directory:
+        template_path = os.path.join(directory, 'template.xlsx')
+        make_template_workbook(template_path)
+        check_clear_data_merges(template_path)
+        check_template_styles(template_path, directory)
+        check_logbook_template(template_path, directory)
+    check_copy_print_settings()
+    print("ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Benchmarks de ponta a ponta, sem rede: parsing, ingestão, exportação e reorganização do logbook.
+
+Cada cenário corre num processo próprio, dentro de uma pasta temporária com uma cópia dos CSVs
+do projeto e um template gerado, e mede o tempo e o pico de memória (RSS) desse processo. Os
+emails e voos sintéticos usam aeroportos e matrículas reais dos CSVs; o Gmail é o serviço falso
+com latência configurável e a DB é o mongomock ou, com --mongo, um mongod local descartável
+(a base "logbook" desse servidor é apagada).
+
+    parse    ler os voos dos emails (create_flight_from_email)
+    ingest   listar, descarregar e ler os emails, guardar os voos e mover os emails para o lixo
+    export   exportar da DB para um logbook novo (export_new_flights)
+    rebuild  reorganizar um logbook já existente (main.py --rebuild)
+    csv      exportar da DB para CSV com as colunas EASA (export.py)
+    columnar exportar da DB para Parquet, ou NDJSON comprimido sem o pyarrow (export.py)
+
+Uso: python benchmarks/run.py [--scenarios parse,ingest,export,rebuild,csv,columnar] [--sizes 1000,10000,100000]
+                              [--latency S] [--mongo URI] [--output FICHEIRO.json]
+                              [--baseline FICHEIRO.json] [--tolerance 0.2]
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from synthetic import REPO_PATH, make_flight_dicts, make_logbook_emails, make_template_workbook, real_airports, real_registrations
+
+SCENARIOS = ('parse', 'ingest', 'export', 'rebuild', 'csv', 'columnar')
+SIZES = (1000, 10000, 100000)
+
+# Sectores por email gerado, em média (ver make_logbook_emails)
+FLIGHTS_PER_EMAIL = 4
+
+# Acima disto o mongomock deixa de ser útil: cada upsert percorre a coleção inteira
+MONGOMOCK_WRITE_LIMIT = 2000
+
+def peak_rss_mb():
+    """Pico de memória residente deste processo, em MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Em Linux vem em KB, em macOS em bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+def connect(mongo_uri):
+    """Cliente da DB dos benchmarks, com a base "logbook" vazia."""
+    if mongo_uri:
+        import pymongo
+        client = pymongo.MongoClient(mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client.drop_database("logbook")
+    return client
+
+def make_emails(size):
+    iata, _ = real_airports()
+    return make_logbook_emails(max(1, size // FLIGHTS_PER_EMAIL), airports=iata, registrations=real_registrations())
+
+def make_flights(size):
+    _, icao = real_airports()
+    return make_flight_dicts(size, airports=icao, registrations=real_registrations())
+
+def run_parse(size, args):
+    from flights import create_flight_from_email, load_aircraft_data
+    emails = make_emails(size)
+    aircraft_data = load_aircraft_data()
+
+    start = time.perf_counter()
+    flights = sum(len(create_flight_from_email(body, aircraft_data) or []) for body in emails)
+    return time.perf_counter() - start, {'emails': len(emails), 'flights': flights}
+
+def run_ingest(size, args):
+    from fake_gmail import FakeGmailService
+    from database import get_database
+    from email_connect import LOGBOOK_QUERY, fetch_emails
+    from flights import load_aircraft_data
+    from main import ingest_emails
+
+    service = FakeGmailService(latency=args.latency)
+    for body in make_emails(size):
+        service.add_message("Logbook", body)
+    flights_collection = get_database(connect(args.mongo))
+    aircraft_data = load_aircraft_data()
+
+    start = time.perf_counter()
+    # O ingest_emails imprime o assunto de cada email
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
+        flights, _ = ingest_emails(service, lambda: service, email_ids, flights_collection, aircraft_data)
+    return time.perf_counter() - start, {'emails': len(email_ids), 'flights': flights, 'gmail_round_trips': service.round_trips}
+
+def run_export(size, args):
+    from database import get_state_collection
+    from main import export_new_flights
+
+    client = connect(args.mongo)
+    # Sem o índice único: com o mongomock cada inserção verificaria a coleção inteira
+    flights_collection = client["logbook"]["flights"]
+    flights_collection.insert_many(make_flights(size))
+
+    start = time.perf_counter()
+    flights = export_new_flights(flights_collection, get_state_collection(client), None)
+    return time.perf_counter() - start, {'flights': flights}
+
+def run_file_export(size, args, file_format):
+    from export import export_flights
+
+    client = connect(args.mongo)
+    flights_collection = client["logbook"]["flights"]
+    flights_collection.insert_many(make_flights(size))
+
+    path = 'flights.csv' if file_format == 'csv' else ('flights.parquet' if file_format == 'parquet' else 'flights.ndjson.gz')
+    start = time.perf_counter()
+    flights = export_flights(flights_collection, path, file_format)
+    return time.perf_counter() - start, {'flights': flights, 'format': file_format, 'bytes': os.path.getsize(path)}
+
+def run_csv(size, args):
+    return run_file_export(size, args, 'csv')
+
+def run_columnar(size, args):
+    from export import columnar_format
+    return run_file_export(size, args, columnar_format())
+
+def prepare_rebuild(size, args):
+    from excel_manager import write_logbook, load_aircraft_data
+    from main import LOGBOOK_PATH, AIRCRAFT_CSV_PATH
+    # Voos fora de ordem, como depois de exportações incrementais de emails antigos
+    flights = make_flights(size)
+    random.Random(0).shuffle(flights)
+    write_logbook(LOGBOOK_PATH, flights, load_aircraft_data(AIRCRAFT_CSV_PATH))
+
+def run_rebuild(size, args):
+    from excel_manager import reorganize_logbook
+    from main import LOGBOOK_PATH, AIRCRAFT_CSV_PATH
+
+    start = time.perf_counter()
+    reorganize_logbook(LOGBOOK_PATH, AIRCRAFT_CSV_PATH)
+    return time.perf_counter() - start, {'logbook_bytes': os.path.getsize(LOGBOOK_PATH)}
+
+RUNNERS = {'parse': run_parse, 'ingest': run_ingest, 'export': run_export, 'rebuild': run_rebuild,
+           'csv': run_csv, 'columnar': run_columnar}
+PREPARERS = {'rebuild': prepare_rebuild}
+
+def worker(args):
+    """Correr um cenário neste processo e guardar o resultado em JSON em args.result."""
+    from metrics import METRICS
+
+    if args.prepare:
+        PREPARERS[args.worker](args.size, args)
+        return
+
+    setup_rss = current_rss_mb()
+    METRICS.reset()
+    seconds, details = RUNNERS[args.worker](args.size, args)
+    result = {
+        'scenario': args.worker,
+        'size': args.size,
+        'seconds': seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'setup_rss_mb': setup_rss,
+        'details': details,
+        'stages': {name: stats['seconds'] for name, stats in METRICS.summary()['stages'].items()},
+    }
+    with open(args.result, 'w') as file:
+        json.dump(result, file)
+
+def make_workdir(root):
+    """Pasta de trabalho com os CSVs do projeto e um template gerado em _internal/, como na instalação."""
+    workdir = os.path.join(root, 'template')
+    internal = os.path.join(workdir, '_internal')
+    os.makedirs(internal)
+    for name in ('iata_to_icao_coords.csv', 'ryanair_aircrafts.csv'):
+        shutil.copy(os.path.join(REPO_PATH, '_internal', name), internal)
+    make_template_workbook(os.path.join(internal, 'logbook_template.xlsx'))
+    return workdir
+
+def run_scenario(scenario, size, args, template_dir, root):
+    """Correr um cenário num processo novo e devolver o resultado."""
+    workdir = os.path.join(root, f"{scenario}-{size}")
+    shutil.copytree(template_dir, workdir)
+    result_path = os.path.join(workdir, 'result.json')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', scenario, '--size', str(size),
+               '--result', result_path, '--latency', str(args.latency)]
+    if args.mongo:
+        command += ['--mongo', args.mongo]
+    try:
+        if scenario in PREPARERS:
+            subprocess.run(command + ['--prepare'], cwd=workdir, check=True)
+        subprocess.run(command, cwd=workdir, check=True)
+        with open(result_path) as file:
+            return json.load(file)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(results, baseline, tolerance):
+    """Cenários mais lentos ou com mais memória do que na baseline, acima da tolerância."""
+    previous = {(result['scenario'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['scenario'], result['size']))
+        if old is None:
+            continue
+        for field in ('seconds', 'peak_rss_mb'):
+            if old.get(field) and result.get(field) and result[field] > old[field] * (1 + tolerance):
+                regressions.append(f"{result['scenario']} {result['size']}: {field} {old[field]:.2f} -> {result[field]:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de ponta a ponta com dados sintéticos, Gmail falso e mongomock")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="cenários a correr, separados por vírgulas")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="números de voos, separados por vírgulas")
+    parser.add_argument("--latency", type=float, default=0.0, help="latência simulada de cada pedido ao Gmail, em segundos")
+    parser.add_argument("--mongo", help="URI de um mongod local descartável (por omissão, mongomock)")
+    parser.add_argument("--output", help="guardar os resultados neste ficheiro JSON")
+    parser.add_argument("--baseline", help="resultados anteriores (JSON) com que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="aumento relativo tolerado face à baseline")
+    # Uso interno: correr um único cenário no processo atual
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",")]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"cenário desconhecido: {scenario}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        template_dir = make_workdir(root)
+        print(f"{'cenário':<8} {'voos':>7} {'tempo (s)':>10} {'voos/s':>9} {'pico RSS (MB)':>14}")
+        for scenario in scenarios:
+            for size in sizes:
+                if scenario == 'ingest' and not args.mongo and size > MONGOMOCK_WRITE_LIMIT:
+                    print(f"{scenario:<8} {size:>7} ignorado: acima de {MONGOMOCK_WRITE_LIMIT} voos use --mongo")
+                    continue
+                result = run_scenario(scenario, size, args, template_dir, root)
+                results.append(result)
+                rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else "-"
+                flights = result['details'].get('flights', size)
+                print(f"{scenario:<8} {size:>7} {result['seconds']:>10.2f} {flights / result['seconds']:>9.0f} {rss:>14}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regressão: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Dados sintéticos para os benchmarks: template do logbook, voos e emails de logbook aleatórios."""
+import os
+import random
+from datetime import datetime, timedelta
+import openpyxl
+from openpyxl.styles import Border, Font, Side
+from aircraft_registry import AIRCRAFT_CSV, AircraftRegistry
+from flights import AIRPORTS_CSV, load_iata_to_icao_coords
+
+REPO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEADERS = ['', 'DATE', 'DEP', 'TIME', 'ARR', 'TIME', 'TYPE', 'REG', '', '', 'SPT', 'MPT', 'PIC NAME',
+           'TO DAY', 'TO NIGHT', 'LDG DAY', 'LDG NIGHT', 'NIGHT', 'IFR', 'PIC', 'CO-PILOT']
+IATA_AIRPORTS = ['LIS', 'OPO', 'FAO', 'DUB', 'STN', 'MAD', 'FCO', 'BER', 'BVA', 'KRK']
+AIRPORTS = ['LPPT', 'LPPR', 'LPFR', 'EIDW', 'EGSS', 'LEMD', 'LIRF', 'EDDB', 'LFPB', 'EPKK']
+REGISTRATIONS = ['EI-DCJ', 'EI-DCK', 'EI-EBA', 'EI-IGA', 'EI-HGA', '9H-QAA']
+
+# Campos que podem vir em branco nos emails (ex: 'Registration : ' seguido do campo seguinte)
+BLANK_FIELDS = ('Registration', 'Total flight', 'Take Offs Day', 'Landings Night', 'Night Flight Time', 'IFR Time')
+
+def real_airports():
+    """Códigos IATA e ICAO de todos os aeroportos do CSV do projeto."""
+    table = load_iata_to_icao_coords(os.path.join(REPO_PATH, AIRPORTS_CSV))
+    return sorted(table), sorted(icao for icao, _, _ in table.values())
+
+def real_registrations():
+    """Matrículas da frota no CSV das aeronaves do projeto."""
+    registry = AircraftRegistry(os.path.join(REPO_PATH, AIRCRAFT_CSV))
+    registry.refresh()
+    return sorted(registry.aircraft)
+
+def make_template_workbook(path, max_rows=1500, header_row=2):
+    """Criar um template parecido com o real: cabeçalho, bordas e uma célula mesclada por linha."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Sheet0"
+    ws['B1'] = "PILOT LOGBOOK"
+    ws.merge_cells('B1:U1')
+    for column, title in enumerate(HEADERS, start=1):
+        if title:
+            ws.cell(row=header_row, column=column, value=title).font = Font(bold=True)
+    thin = Side(style='thin')
+    for row in range(header_row + 1, header_row + 1 + max_rows):
+        ws.merge_cells(start_row=row, start_column=9, end_row=row, end_column=10)
+        for column in range(2, 22):
+            ws.cell(row=row, column=column).border = Border(bottom=thin)
+    wb.save(path)
+
+def make_flight_dicts(count, seed=0, start=datetime(2015, 1, 1), airports=AIRPORTS, registrations=REGISTRATIONS):
+    """Gerar voos no formato guardado na DB, por ordem cronológica, entre os aeroportos ICAO dados."""
+    rng = random.Random(seed)
+    flights = []
+    current = start
+    for _ in range(count):
+        current += timedelta(minutes=rng.randint(90, 600))
+        duration = timedelta(minutes=rng.randint(45, 240))
+        arrival = current + duration
+        departure_airport, arrival_airport = rng.sample(airports, 2)
+        block = f"{duration.seconds // 3600:02d}:{duration.seconds % 3600 // 60:02d}"
+        flights.append({
+            'date': current.strftime('%Y/%m/%d'),
+            'departure_airport': departure_airport,
+            'arrival_airport': arrival_airport,
+            'departure_time': current.strftime('%H:%M'),
+            'arrival_time': arrival.strftime('%H:%M'),
+            'aircraft_registration': rng.choice(registrations),
+            'aircraft_type': 'Boeing 737-800',
+            'flight_time': block,
+            'captain': 'JOHN DOE',
+            'takeoffs_day': 1,
+            'takeoffs_night': 0,
+            'landings_day': 1,
+            'landings_night': 0,
+            'night_flight_time': '00:00',
+            'ifr_time': block,
+            'datetime': current,
+        })
+    return flights
+
+def make_logbook_email(rng, day, sectors=4, airports=IATA_AIRPORTS, registrations=REGISTRATIONS, blank_rate=0.0):
+    """Gerar o corpo de um email de logbook com o número de sectores dado, entre os aeroportos IATA dados.
+
+    Com blank_rate, essa fração dos sectores tem um dos BLANK_FIELDS sem valor.
+    """
+    lines = [
+        "Logbook",
+        f"Date : {day.strftime('%Y/%m/%d')}",
+        "",
+        "Flight Deck Crew  1 : CP : JOHN DOE",
+        "Flight Deck Crew  2 : FO : JANE ROE",
+        "",
+    ]
+    airport = rng.choice(airports)
+    current = day.replace(hour=5) + timedelta(minutes=rng.randint(0, 240))
+    for _ in range(sectors):
+        destination = rng.choice(airports)
+        while destination == airport:
+            destination = rng.choice(airports)
+        duration = rng.randint(45, 240)
+        landed = current + timedelta(minutes=duration)
+        block = f"{duration // 60:02d}:{duration % 60:02d}"
+        sector = [
+            f"FlightNumber : FR{rng.randint(100, 9999)}",
+            f"City Pair : {airport} - {destination}",
+            f"Registration : {rng.choice(registrations).replace('-', '')}",
+            f"Airborne : {current.strftime('%H:%M')}",
+            f"Landed : {landed.strftime('%H:%M')}",
+            f"Total flight : {block}",
+            "Take Offs Day : 1",
+            "Take Offs Night : 0",
+            "Landings Day : 1",
+            "Landings Night : 0",
+            "Night Flight Time : 00:00",
+            f"IFR Time : {block}",
+            "",
+        ]
+        if blank_rate and rng.random() < blank_rate:
+            blank = rng.choice(BLANK_FIELDS)
+            sector = [f"{blank} : " if line.startswith(f"{blank} :") else line for line in sector]
+        lines += sector
+        airport = destination
+        current = landed + timedelta(minutes=rng.randint(25, 60))
+    return "\n".join(lines)
+
+def make_logbook_emails(count, seed=0, start=datetime(2015, 1, 1), airports=IATA_AIRPORTS, registrations=REGISTRATIONS, blank_rate=0.0):
+    """Gerar um corpus de emails de logbook, um por dia de trabalho (4 sectores por email, em média)."""
+    rng = random.Random(seed)
+    return [make_logbook_email(rng, start + timedelta(days=index), rng.randint(2, 6), airports, registrations, blank_rate)
+            for index in range(count)]
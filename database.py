@@ -1,34 +1,336 @@
+import os
+import re
+import time
 import pymongo
 import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, WriteConcern, monitoring
+from pymongo.errors import BulkWriteError, OperationFailure
+from rollups import ensure_rollup_indexes
+from night_time import compute_night_minutes, flight_duration_minutes, format_minutes
+from metrics import METRICS
 
-def db_connect(db_link):
+# Campos que identificam um voo: o mesmo avião não descola duas vezes do mesmo aeroporto à mesma hora
+FLIGHT_KEY = ('date', 'departure_time', 'departure_airport', 'aircraft_registration')
+DUPLICATE_KEY_ERROR = 11000
 
+# Campos lidos para escrever um voo no logbook (ver excel_manager.flight_row_values)
+EXPORT_FIELDS = ('date', 'departure_airport', 'departure_time', 'arrival_airport', 'arrival_time',
+                 'aircraft_registration', 'flight_time', 'captain', 'takeoffs_day', 'takeoffs_night',
+                 'landings_day', 'landings_night', 'night_flight_time', 'ifr_time', 'datetime')
+
+# Opções do MongoClient lidas do ambiente: variável -> (opção, conversão, valor por omissão)
+CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int, 20),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int, 0),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int, 5000),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int, 5000),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int, 60000),
+    'MONGO_RETRY_WRITES': ('retryWrites', lambda value: value.lower() in ('1', 'true', 'yes'), True),
+    'MONGO_COMPRESSORS': ('compressors', str, None),
+}
+
+def redact_link(db_link):
+    """Link de ligação sem o utilizador e a palavra-passe, para poder ir para os logs."""
+    return re.sub(r'//[^@/]+@', '//***:***@', db_link)
+
+def client_options_from_env():
+    """Opções do MongoClient configuradas pelas variáveis MONGO_* (ver CLIENT_OPTIONS)."""
+    options = {}
+    for variable, (option, convert, default) in CLIENT_OPTIONS.items():
+        value = os.getenv(variable)
+        value = convert(value) if value else default
+        if value is not None:
+            options[option] = value
+    return options
+
+def ingest_write_concern():
+    """Write concern das escritas em massa (MONGO_INGEST_W e MONGO_INGEST_J), ou None para usar a do cliente."""
+    w = os.getenv("MONGO_INGEST_W")
+    journal = os.getenv("MONGO_INGEST_J")
+    if not w and not journal:
+        return None
+    w = int(w) if w and w.isdigit() else (w or None)
+    return WriteConcern(w=w, j=journal.lower() in ('1', 'true', 'yes') if journal else None)
+
+class CommandLatency(monitoring.CommandListener):
+    """Número de comandos, tempo total e máximo (ms) por comando enviado ao MongoDB."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.connect_ms = None
+
+    def record(self, event, failed=False):
+        with self.lock:
+            stats = self.stats.setdefault(event.command_name, {'count': 0, 'failures': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            METRICS.count('db_round_trips')
+            milliseconds = event.duration_micros / 1000
+            stats['count'] += 1
+            stats['failures'] += failed
+            stats['total_ms'] += milliseconds
+            stats['max_ms'] = max(stats['max_ms'], milliseconds)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event)
+
+    def failed(self, event):
+        self.record(event, failed=True)
+
+    def summary(self):
+        """Cópia das estatísticas, com a latência média de cada comando e a da ligação inicial."""
+        with self.lock:
+            commands = {name: dict(stats, avg_ms=stats['total_ms'] / stats['count']) for name, stats in self.stats.items()}
+        return {'connect_ms': self.connect_ms, 'commands': commands}
+
+COMMAND_LATENCY = CommandLatency()
+
+def db_connect(db_link, client_factory=pymongo.MongoClient, **options):
+    """Criar um MongoClient configurado pelo ambiente e confirmar a ligação com um ping.
+
+    Falha logo se o servidor não responder dentro de serverSelectionTimeoutMS. client_factory
+    permite usar outro cliente compatível (ex: mongomock.MongoClient). options sobrepõem-se às do ambiente.
+    """
     if not db_link:
         raise ValueError("DB_LINK environment variable not found")
 
-    logging.info(f"DB_LINK: {db_link}")
+    logging.info(f"DB_LINK: {redact_link(db_link)}")
 
+    myclient = None
     try:
         # Connection to the DB
-        myclient = pymongo.MongoClient(db_link)
-        logging.info("Conexão com MongoDB estabelecida com sucesso.")
+        options = {**client_options_from_env(), **options}
+        myclient = client_factory(db_link, event_listeners=[COMMAND_LATENCY], **options)
+
+        start = time.perf_counter()
+        myclient.admin.command('ping')
+        COMMAND_LATENCY.connect_ms = (time.perf_counter() - start) * 1000
+        logging.info(f"Conexão com MongoDB estabelecida com sucesso ({COMMAND_LATENCY.connect_ms:.0f} ms).")
 
         return myclient
     except Exception as e:
         logging.error(f"Erro ao conectar ao MongoDB: {e}")
+        if myclient is not None:
+            myclient.close()
         raise
 
-def get_database(myclient):
+_client = None
+_client_lock = threading.Lock()
+
+def get_client(db_link=None, client_factory=pymongo.MongoClient):
+    """Cliente partilhado pelo processo, criado na primeira chamada (por omissão com DB_LINK)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = db_connect(db_link or os.getenv("DB_LINK"), client_factory)
+        return _client
+
+def close_client():
+    """Fechar o cliente partilhado, se existir."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+def collection_name(name, tenant=None):
+    """Nome da coleção, ou da coleção do piloto dado no modo multi-piloto (ex: flights.jdoe)."""
+    return f"{name}.{tenant}" if tenant else name
+
+def get_database(myclient, tenant=None):
 
     try:
         # Select the database
         mydb = myclient["logbook"]
 
-        # Select the collection
-        mycol = mydb["flights"]
+        # Select the collection (uma por piloto no modo multi-piloto, com os mesmos índices)
+        mycol = mydb[collection_name("flights", tenant)]
+
+        ensure_indexes(mycol)
 
         logging.info("Database e coleção selecionados com sucesso.")
         return mycol
     except Exception as e:
         logging.error(f"Erro ao selecionar a base de dados ou coleção: {e}")
         raise
+
+def ensure_indexes(collection):
+    """Criar os índices da coleção de voos, se ainda não existirem."""
+    # Índice usado pelas exportações incrementais
+    collection.create_index([('datetime', pymongo.ASCENDING)])
+    ensure_rollup_indexes(collection)
+    try:
+        collection.create_index([(field, pymongo.ASCENDING) for field in FLIGHT_KEY], unique=True, name='flight_key')
+    except OperationFailure as e:
+        # Voos duplicados já guardados impedem o índice único; os upserts continuam a evitar novos duplicados
+        logging.error(f"Não foi possível criar o índice único dos voos: {e}")
+
+def flight_key(flight_dict):
+    return {field: flight_dict[field] for field in FLIGHT_KEY}
+
+@METRICS.timed('db_upsert')
+def upsert_flights(collection, flight_dicts):
+    """Guardar os voos com upserts pela chave do voo, sem criar duplicados.
+
+    Devolve um dicionário com o número de voos inseridos, atualizados e duplicados (já guardados
+    sem alterações, ou repetidos na própria lista).
+    """
+    # Na mesma lista, o último voo com a mesma chave prevalece
+    unique = {}
+    for flight_dict in flight_dicts:
+        unique[tuple(flight_dict[field] for field in FLIGHT_KEY)] = flight_dict
+    counts = {'inserted': 0, 'updated': 0, 'duplicates': len(flight_dicts) - len(unique)}
+    if not unique:
+        return counts
+
+    write_concern = ingest_write_concern()
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+
+    operations = [UpdateOne(flight_key(flight_dict), {'$set': flight_dict}, upsert=True) for flight_dict in unique.values()]
+    try:
+        result = collection.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        # Upserts concorrentes da mesma chave falham com chave duplicada: o voo já está guardado
+        result = e.details
+        other_errors = [error for error in result['writeErrors'] if error['code'] != DUPLICATE_KEY_ERROR]
+        if other_errors:
+            raise
+        counts['duplicates'] += len(result['writeErrors'])
+
+    counts['inserted'] += result['nUpserted']
+    counts['updated'] += result['nModified']
+    counts['duplicates'] += result['nMatched'] - result['nModified']
+    for key, value in counts.items():
+        METRICS.count(f"db_flights_{key}", value)
+    logging.info(f"Voos guardados: {counts['inserted']} inseridos, {counts['updated']} atualizados, "
+                 f"{counts['duplicates']} duplicados")
+    return counts
+
+def get_state_collection(myclient, tenant=None):
+    """Coleção com o estado persistente entre execuções (ex: marca da última exportação), uma por piloto."""
+    return myclient["logbook"][collection_name("state", tenant)]
+
+def get_export_mark(state_collection, target):
+    """Devolver o _id do último voo exportado para o destino dado, ou None."""
+    state = state_collection.find_one({'_id': f"export:{target}"})
+    return state['last_id'] if state else None
+
+def set_export_mark(state_collection, target, last_id, last_datetime):
+    """Guardar a marca da última exportação para o destino dado."""
+    state_collection.update_one(
+        {'_id': f"export:{target}"},
+        {'$set': {'last_id': last_id, 'last_datetime': last_datetime, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+def get_gmail_history_id(state_collection):
+    """Devolver o historyId do Gmail a partir do qual continuar a sincronização, ou None."""
+    state = state_collection.find_one({'_id': "gmail:history"})
+    return state['history_id'] if state else None
+
+def get_gmail_pending_ids(state_collection):
+    """IDs dos emails que falharam na última sincronização e devem ser pedidos de novo."""
+    state = state_collection.find_one({'_id': "gmail:history"})
+    return state.get('pending_ids', []) if state else []
+
+def set_gmail_history_id(state_collection, history_id, pending_ids=()):
+    """Guardar o historyId do Gmail até onde os emails já foram processados e os IDs dos emails
+    anteriores que ainda falta processar."""
+    state_collection.update_one(
+        {'_id': "gmail:history"},
+        {'$set': {'history_id': history_id, 'pending_ids': list(pending_ids), 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+def get_latest_flight_id(collection):
+    """Devolver o _id do voo inserido mais recentemente, ou None se a coleção estiver vazia."""
+    latest = collection.find_one({}, {'_id': 1}, sort=[('_id', pymongo.DESCENDING)])
+    return latest['_id'] if latest else None
+
+def iter_flights(collection, start=None, end=None, after_id=None, fields=EXPORT_FIELDS, include_id=False, batch_size=1000):
+    """Percorrer os voos ordenados por data e hora no servidor, com um cursor em lotes.
+
+    start e end filtram o campo datetime (start incluído, end excluído). after_id devolve apenas os
+    voos inseridos depois desse _id: o ObjectId cresce com a ordem de inserção, por isso voos de
+    emails que chegam fora de ordem também são apanhados, mesmo que sejam mais antigos que a última
+    exportação. Só os campos em fields são lidos; o _id só é incluído se include_id for verdadeiro.
+    """
+    query = {}
+    if start is not None or end is not None:
+        query['datetime'] = {}
+        if start is not None:
+            query['datetime']['$gte'] = start
+        if end is not None:
+            query['datetime']['$lt'] = end
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+
+    projection = dict.fromkeys(fields, 1)
+    projection['_id'] = 1 if include_id else 0
+    return collection.find(query, projection, batch_size=batch_size).sort('datetime', pymongo.ASCENDING)
+
+def backfill_night_flight_time(flights_collection, airport_for, solar_times, batch_size=5000):
+    """Recalcular o tempo noturno e as aterragens diurnas/noturnas de todos os voos da DB.
+
+    airport_for recebe o código ICAO guardado na DB e devolve (IATA, (latitude, longitude)) ou None;
+    solar_times é consultado pelo código IATA, como no parser, para partilhar as mesmas entradas.
+    Os voos com aeroportos desconhecidos ficam como estão. Devolve o número de voos atualizados.
+    """
+    projection = {'_id': 1, 'departure_airport': 1, 'arrival_airport': 1, 'departure_time': 1,
+                  'arrival_time': 1, 'datetime': 1, 'night_flight_time': 1, 'landings_day': 1, 'landings_night': 1}
+    cursor = flights_collection.find({}, projection, batch_size=batch_size)
+
+    updated = 0
+    batch = []
+    for flight in cursor:
+        batch.append(flight)
+        if len(batch) >= batch_size:
+            updated += _backfill_batch(flights_collection, batch, airport_for, solar_times)
+            batch = []
+    if batch:
+        updated += _backfill_batch(flights_collection, batch, airport_for, solar_times)
+
+    logging.info(f"Tempo noturno recalculado: {updated} voos atualizados")
+    return updated
+
+def _backfill_batch(flights_collection, flights, airport_for, solar_times):
+    known = []
+    for flight in flights:
+        departure = airport_for(flight['departure_airport'])
+        arrival = airport_for(flight['arrival_airport'])
+        if departure and arrival:
+            known.append((flight, departure[1], arrival))
+    if not known:
+        return 0
+
+    durations = [flight_duration_minutes(flight['departure_time'], flight['arrival_time']) for flight, _, _ in known]
+    night_minutes = compute_night_minutes(
+        [departure for _, departure, _ in known],
+        [arrival[1] for _, _, arrival in known],
+        [flight['datetime'] for flight, _, _ in known],
+        durations,
+    )
+    landings = [flight['datetime'] + timedelta(minutes=duration) for (flight, _, _), duration in zip(known, durations)]
+    sun_times = solar_times.get_many([
+        (arrival_iata, landing, arrival) for (_, _, (arrival_iata, arrival)), landing in zip(known, landings)
+    ])
+
+    operations = []
+    for (flight, _, _), minutes, landing, (sunrise, sunset) in zip(known, night_minutes.tolist(), landings, sun_times):
+        landing_at_night = landing.time() < sunrise or landing.time() > sunset
+        changes = {
+            'night_flight_time': format_minutes(minutes),
+            'landings_day': 0 if landing_at_night else 1,
+            'landings_night': 1 if landing_at_night else 0,
+        }
+        if any(flight.get(field) != value for field, value in changes.items()):
+            operations.append(UpdateOne({'_id': flight['_id']}, {'$set': changes}))
+
+    if operations:
+        flights_collection.bulk_write(operations, ordered=False)
+    return len(operations)
@@ -1,14 +1,20 @@
 import os
 import base64
 import logging
+import random
 import sys
-from email import message_from_bytes
-from email.header import decode_header
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from email.header import decode_header, make_header
 from dotenv import load_dotenv
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from metrics import METRICS
 
 # Load environment variables
 load_dotenv()
@@ -16,7 +22,12 @@ load_dotenv()
 # Define the scope for Gmail modification
 SCOPES = ['https://mail.google.com/']
 
-def connect_to_gmail():
+def connect_to_gmail(token_path=None, interactive=True):
+    """Gmail credentials from token_path (token.json by default), refreshed if expired.
+
+    Without a valid token, runs the browser consent flow and saves the new token; with
+    interactive=False (e.g. one mailbox of the roster) it returns None instead.
+    """
     creds = None
     # Determine base path
     if getattr(sys, 'frozen', False):
@@ -27,7 +38,7 @@ def connect_to_gmail():
         base_path = os.path.abspath(".")
     
     credential_path = os.path.join(base_path, 'credentials.json')
-    token_path = os.path.join(base_path, 'token.json')
+    token_path = token_path or os.path.join(base_path, 'token.json')
 
     logging.info(f"Credential path: {credential_path}")
     
@@ -36,6 +47,9 @@ def connect_to_gmail():
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif not interactive:
+            logging.error(f"No valid Gmail token in {token_path}")
+            return None
         else:
             flow = InstalledAppFlow.from_client_secrets_file(credential_path, SCOPES)
             creds = flow.run_local_server(port=0)
@@ -44,24 +58,158 @@ def connect_to_gmail():
 
     return creds
 
-def fetch_emails(service, folder="INBOX"):
-    # Use the Gmail API to fetch emails from the specified folder
-    results = service.users().messages().list(userId='me', labelIds=[folder]).execute()
-    return results.get('messages', [])
-
-def get_email_subject(service, email_id):
-    # Fetch the email by ID
-    msg = service.users().messages().get(userId='me', id=email_id['id'], format='raw').execute()
-    msg_str = base64.urlsafe_b64decode(msg['raw'].encode('ASCII'))
-    mime_msg = message_from_bytes(msg_str)
-    subject, encoding = decode_header(mime_msg["Subject"])[0]
-    if isinstance(subject, bytes):
-        subject = subject.decode(encoding if encoding else "utf-8")
-    return subject
+# Gmail search used to list only the candidate logbook emails
+LOGBOOK_QUERY = 'subject:logbook'
+
+# Requests per batch HTTP call (Gmail accepts up to 100, but recommends 50 to avoid rate limiting)
+BATCH_SIZE = 50
+
+# Worker threads downloading email bodies, and how many downloads may be queued ahead of the parser
+MAX_WORKERS = 8
+MAX_PENDING = 2 * MAX_WORKERS
+
+# Retries for rate-limited or failed API calls, with exponential backoff and jitter
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 32.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Maximum number of message IDs accepted by messages.batchModify
+BATCH_MODIFY_LIMIT = 1000
+
+def iter_email_ids(service, folder="INBOX", query=None):
+    """Yield every message ID in the folder, following nextPageToken through all result pages."""
+    page_token = None
+    while True:
+        results = execute_with_retry(service.users().messages().list(
+            userId='me', labelIds=[folder], q=query, pageToken=page_token))
+        messages = results.get('messages', [])
+        METRICS.count('emails_listed', len(messages))
+        yield from messages
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+@METRICS.timed('gmail_list')
+def fetch_emails(service, folder="INBOX", query=None):
+    # Use the Gmail API to fetch emails from the specified folder, optionally filtered by a search query
+    return list(iter_email_ids(service, folder, query))
+
+def get_history_id(service):
+    """Current historyId of the mailbox, the starting point for incremental syncs."""
+    return execute_with_retry(service.users().getProfile(userId='me'))['historyId']
+
+@METRICS.timed('gmail_history')
+def fetch_new_email_ids(service, start_history_id, folder="INBOX"):
+    """List the messages added to the folder since start_history_id.
+
+    Returns (email_ids, history_id), where history_id is the point to resume from next time.
+    Gmail answers 404 when start_history_id is too old; the HttpError is raised so the caller
+    can fall back to a full listing.
+    """
+    email_ids = {}
+    history_id = start_history_id
+    page_token = None
+    while True:
+        results = execute_with_retry(service.users().history().list(
+            userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+            labelId=folder, pageToken=page_token))
+        METRICS.count('gmail_history_pages')
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                email_ids[added['message']['id']] = {'id': added['message']['id'], 'threadId': added['message'].get('threadId')}
+        history_id = results.get('historyId', history_id)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return list(email_ids.values()), history_id
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        if error.resp.status in RETRYABLE_STATUS:
+            return True
+        # Gmail also reports per-user rate limits as 403
+        return error.resp.status == 403 and b'rateLimitExceeded' in (error.content or b'')
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def is_missing(error):
+    """True when the message no longer exists, so asking for it again is pointless."""
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+def backoff_delay(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
 
+def execute_with_retry(request, max_retries=MAX_RETRIES):
+    """Execute an API request, retrying rate-limit and transient errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            METRICS.count('gmail_requests')
+            return request.execute()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"Gmail request failed ({e}), retrying in {delay:.1f}s")
+            METRICS.count('gmail_retries')
+            time.sleep(delay)
+
+def subject_from_metadata(msg):
+    """Read the decoded Subject header from a message fetched with format='metadata'."""
+    for header in msg.get('payload', {}).get('headers', []):
+        if header['name'].lower() == 'subject':
+            return str(make_header(decode_header(header['value'])))
+    return ""
+
+@METRICS.timed('gmail_subjects')
+def get_email_subjects(service, email_ids, failed=None, max_retries=MAX_RETRIES):
+    """Fetch the subjects of many emails with batch HTTP requests of BATCH_SIZE messages each.
+
+    Returns a dict of email ID -> subject. Sub-requests rejected with a rate-limit or transient
+    error are sent again in a new batch, with backoff. Messages that still fail are logged, left
+    out and, if a failed list is given, appended to it (except those that no longer exist).
+    """
+    subjects = {}
+    retry = []
+
+    def store_subject(request_id, response, exception):
+        if exception is None:
+            subjects[request_id] = subject_from_metadata(response)
+        elif is_retryable(exception):
+            retry.append((request_id, exception))
+        else:
+            logging.error(f"Falha ao obter o assunto do email com ID: {request_id}, erro: {exception}")
+            if failed is not None and not is_missing(exception):
+                failed.append(request_id)
+
+    pending = [email_id['id'] for email_id in email_ids]
+    for attempt in range(max_retries + 1):
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=store_subject)
+            for email_id in pending[start:start + BATCH_SIZE]:
+                batch.add(service.users().messages().get(userId='me', id=email_id, format='metadata',
+                                                         metadataHeaders=['Subject']),
+                          request_id=email_id)
+            METRICS.count('gmail_requests')
+            batch.execute()
+        if not retry:
+            break
+        if attempt == max_retries:
+            for email_id, exception in retry:
+                logging.error(f"Falha ao obter o assunto do email com ID: {email_id}, erro: {exception}")
+                if failed is not None:
+                    failed.append(email_id)
+            break
+        delay = backoff_delay(attempt)
+        logging.warning(f"{len(retry)} subject requests failed in the batch, retrying in {delay:.1f}s")
+        METRICS.count('gmail_retries', len(retry))
+        time.sleep(delay)
+        pending = [email_id for email_id, _ in retry]
+        retry.clear()
+    return subjects
+
+@METRICS.timed('gmail_fetch_body')
 def get_email_body(service, email_id):
     """Fetch the body of an email by ID."""
-    msg = service.users().messages().get(userId='me', id=email_id, format='full').execute()
+    msg = execute_with_retry(service.users().messages().get(userId='me', id=email_id, format='full'))
     payload = msg['payload']
     parts = payload.get('parts')
     body = ""
@@ -85,24 +233,60 @@ def get_email_body(service, email_id):
         if data:
             body += base64.urlsafe_b64decode(data).decode('utf-8')
 
+    METRICS.count('emails_fetched')
+    METRICS.count('email_bytes_fetched', len(body))
     return body
 
-def print_email_subjects(service, email_ids):
-    for email_id in email_ids:
-        subject = get_email_subject(service, email_id)
-        print(f"Subject: {subject}")
+def stream_email_bodies(service_factory, email_ids, max_workers=MAX_WORKERS, max_pending=MAX_PENDING, failed=None):
+    """Download email bodies on a bounded thread pool and yield (email ID, body) as they arrive.
+
+    Gmail service objects are not thread-safe, so each worker builds its own with service_factory().
+    At most max_pending downloads run ahead of the consumer, so parsing overlaps with the network
+    without buffering the whole inbox. Emails that still fail after the retries are logged, skipped
+    and, if a failed list is given, appended to it (except those that no longer exist).
+    """
+    local = threading.local()
+
+    def download(email_id):
+        if not hasattr(local, 'service'):
+            local.service = service_factory()
+        return email_id, get_email_body(local.service, email_id)
 
-def filter_logbook_emails(service, email_ids):
-    logbook_emails = []
+    email_ids = iter(email_ids)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(download, email_id['id']): email_id['id'] for email_id in islice(email_ids, max_pending)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for email_id in islice(email_ids, len(done)):
+                pending[executor.submit(download, email_id['id'])] = email_id['id']
+            for future in done:
+                email_id = pending.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logging.error(f"Failed to fetch email body with ID: {email_id}, error: {e}")
+                    if failed is not None and not is_missing(e):
+                        failed.append(email_id)
+
+def print_email_subjects(service, email_ids, subjects=None):
+    if subjects is None:
+        subjects = get_email_subjects(service, email_ids)
     for email_id in email_ids:
-        subject = get_email_subject(service, email_id)
-        if subject.lower() == "logbook":
-            logbook_emails.append(email_id)
-    return logbook_emails
+        print(f"Subject: {subjects.get(email_id['id'], '')}")
+
+def filter_logbook_emails(service, email_ids, subjects=None):
+    # The Gmail search is a word match, so the exact subject is still checked here
+    if subjects is None:
+        subjects = get_email_subjects(service, email_ids)
+    return [email_id for email_id in email_ids if subjects.get(email_id['id'], '').lower() == "logbook"]
 
-def delete_non_logbook_emails(service, email_ids):
+def delete_non_logbook_emails(service, email_ids, subjects=None):
+    if subjects is None:
+        subjects = get_email_subjects(service, email_ids)
     for email_id in email_ids:
-        subject = get_email_subject(service, email_id)
+        if email_id['id'] not in subjects:
+            continue  # Subject could not be read, so leave the email alone
+        subject = subjects[email_id['id']]
         if subject.lower() != "logbook":
             # Move the email to the trash
             try:
@@ -111,10 +295,21 @@ def delete_non_logbook_emails(service, email_ids):
             except Exception as e:
                 print(f"Failed to move to trash email with subject: {subject}, error: {e}")
 
-def delete_specific_email(service, email_id):
-    """Delete a specific email by ID."""
-    try:
-        service.users().messages().trash(userId='me', id=email_id).execute()
-        print(f"Moved to trash email with ID: {email_id}")
-    except Exception as e:
-        print(f"Failed to move to trash email with ID: {email_id}, error: {e}")
+@METRICS.timed('gmail_trash')
+def trash_emails(service, email_ids, chunk_size=BATCH_MODIFY_LIMIT):
+    """Move emails to the trash with batchModify, up to chunk_size IDs per request.
+
+    Returns the number of emails moved. Chunks that fail after the retries are logged and left in the inbox.
+    """
+    moved = 0
+    for start in range(0, len(email_ids), chunk_size):
+        chunk = email_ids[start:start + chunk_size]
+        try:
+            execute_with_retry(service.users().messages().batchModify(userId='me', body={
+                'ids': chunk, 'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}))
+            moved += len(chunk)
+            METRICS.count('emails_trashed', len(chunk))
+        except Exception as e:
+            logging.error(f"Failed to move {len(chunk)} emails to trash, error: {e}")
+    print(f"Moved to trash {moved} processed emails")
+    return moved
@@ -1,14 +1,39 @@
 import openpyxl
 from openpyxl import load_workbook
-import csv
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.page import PrintPageSetup
 from datetime import datetime
+import io
 import os
 import shutil
+import zipfile
+import posixpath
+from xml.etree import ElementTree
+from collections import deque
+from copy import copy
+from itertools import islice
+from aircraft_registry import get_aircraft_registry
+from atomic_file import replace_atomically
+from rollups import FlightTotals, TOTAL_FIELDS
+from metrics import METRICS
 
 MAX_FLIGHTS_PER_SHEET = 1500
 TEMPLATE_SHEET_NAME = "Sheet0"
+TEMPLATE_PATH = '_internal/logbook_template.xlsx'
 HEADER_ROW = 2
 
+# Totais acumulados até ao fim de cada folha, guardados num nome definido oculto do workbook com
+# os valores de TOTAL_FIELDS (ex: {1500,90000,...}). Não ocupam células, por isso não dependem do
+# layout do template nem aparecem na folha ou na impressão.
+CARRIED_FORWARD_PREFIX = "_CarriedForward_"
+
+# Folha vazia, posta no lugar das folhas de voos ao ler só a folha template de um logbook
+EMPTY_SHEET_XML = b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData/></worksheet>'
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+PACKAGE_RELATIONSHIP = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+
 def load_excel(file_path, template_path):
     """Carregar o ficheiro Excel ou criar um novo a partir do template."""
     if not os.path.exists(file_path):
@@ -16,151 +41,405 @@ def load_excel(file_path, template_path):
     wb = load_workbook(file_path)
     return wb
 
+def find_free_rows(sheet):
+    """Listar as linhas livres da folha, lendo a coluna B uma única vez."""
+    # Assumindo que a coluna 2 (B) está sempre preenchida
+    column = sheet.iter_rows(min_row=HEADER_ROW + 1, max_row=HEADER_ROW + MAX_FLIGHTS_PER_SHEET,
+                             min_col=2, max_col=2, values_only=True)
+    return [row for row, (value,) in enumerate(column, start=HEADER_ROW + 1) if not value]
+
 def find_next_available_row(sheet):
     """Encontrar a próxima linha disponível na folha."""
-    for row in range(HEADER_ROW + 1, HEADER_ROW + 1 + MAX_FLIGHTS_PER_SHEET):
-        if not sheet.cell(row=row, column=2).value:  # Assumindo que a coluna 2 (B) está sempre preenchida
-            return row
-    return None
+    free_rows = find_free_rows(sheet)
+    return free_rows[0] if free_rows else None
+
+class SheetAllocator:
+    """Distribuir as linhas livres do logbook, criando folhas novas quando a atual enche.
+
+    Cada folha é lida uma única vez, por isso cada linha é entregue em tempo constante.
+    """
+
+    def __init__(self, wb):
+        self.wb = wb
+        self.sheet = None
+        self.free_rows = deque()
+
+        # Encontrar uma folha existente com linhas disponíveis
+        for sheet in wb.worksheets:
+            if sheet.title != TEMPLATE_SHEET_NAME:
+                free_rows = find_free_rows(sheet)
+                if free_rows:
+                    clear_data_merges(sheet, set(free_rows))
+                    self.sheet = sheet
+                    self.free_rows = deque(free_rows)
+                    break
+
+    def next_row(self):
+        """Devolver (folha, linha) para o próximo voo."""
+        if not self.free_rows:
+            self.sheet = create_new_sheet(self.wb)
+            self.free_rows = deque(range(HEADER_ROW + 1, HEADER_ROW + 1 + MAX_FLIGHTS_PER_SHEET))
+        return self.sheet, self.free_rows.popleft()
 
 def load_aircraft_data(csv_file_path):
-    """Carregar dados das aeronaves do ficheiro CSV."""
-    aircraft_data = {}
-    with open(csv_file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            registration = row['Registration'].replace("-", "").upper()
-            aircraft_data[registration] = {
-                'model': row['Aircraft Type'],
-                'variant': 'B737-800' if '737-800' in row['Aircraft Type'] else 'B737-8200' if 'MAX 8' in row['Aircraft Type'] else 'NA'
-            }
-    return aircraft_data
+    """Registo partilhado das aeronaves (o CSV só é lido de novo se for alterado)."""
+    return get_aircraft_registry(csv_file_path)
+
+def sheet_flights(sheet):
+    """Voos de uma folha do logbook, como dicionários no formato da DB."""
+    for values in sheet.iter_rows(min_row=HEADER_ROW + 1, max_row=HEADER_ROW + MAX_FLIGHTS_PER_SHEET,
+                                  max_col=19, values_only=True):
+        values = values + (None,) * (19 - len(values))
+        if not values[1] or not values[3]:
+            continue  # Ignore rows without a date or departure time
+        yield {
+            'date': values[1],
+            'departure_airport': values[2],
+            'departure_time': values[3],
+            'arrival_airport': values[4],
+            'arrival_time': values[5],
+            'aircraft_registration': values[7],
+            'flight_time': values[10],
+            'captain': values[12],
+            'takeoffs_day': values[13],
+            'takeoffs_night': values[14],
+            'landings_day': values[15],
+            'landings_night': values[16],
+            'night_flight_time': values[17],
+            'ifr_time': values[18],
+        }
 
 def get_all_flights(wb):
-    """Extrair todos os voos do logbook."""
+    """Extrair todos os voos do logbook (funciona também com workbooks em modo read-only)."""
     flights = []
     for sheet in wb.worksheets:
         if sheet.title != TEMPLATE_SHEET_NAME:
-            for row in range(HEADER_ROW + 1, HEADER_ROW + 1 + MAX_FLIGHTS_PER_SHEET):
-                date_cell = sheet.cell(row=row, column=2).value
-                departure_time_cell = sheet.cell(row=row, column=4).value
-                if not date_cell or not departure_time_cell:
-                    continue  # Ignore rows without a date or departure time
-                flight_data = {
-                    'date': date_cell,
-                    'departure_airport': sheet.cell(row=row, column=3).value,
-                    'departure_time': departure_time_cell,
-                    'arrival_airport': sheet.cell(row=row, column=5).value,
-                    'arrival_time': sheet.cell(row=row, column=6).value,
-                    'aircraft_registration': sheet.cell(row=row, column=8).value,
-                    'flight_time': sheet.cell(row=row, column=11).value,
-                    'captain': sheet.cell(row=row, column=13).value,
-                    'takeoffs_day': sheet.cell(row=row, column=14).value,
-                    'takeoffs_night': sheet.cell(row=row, column=15).value,
-                    'landings_day': sheet.cell(row=row, column=16).value,
-                    'landings_night': sheet.cell(row=row, column=17).value,
-                    'night_flight_time': sheet.cell(row=row, column=18).value,
-                    'ifr_time': sheet.cell(row=row, column=19).value,
-                }
-                flights.append(flight_data)
+            flights.extend(sheet_flights(sheet))
     return flights
 
+def carried_forward_name(sheet_title):
+    # O título da folha em hexadecimal: os nomes definidos só aceitam letras, dígitos, '_' e '.'
+    return CARRIED_FORWARD_PREFIX + sheet_title.encode('utf-8').hex()
+
+def read_carried_forward(wb, sheet_title):
+    """Totais acumulados até ao fim da folha, ou None se o logbook ainda não os tiver para ela."""
+    defined_name = wb.defined_names.get(carried_forward_name(sheet_title))
+    if defined_name is None:
+        return None
+    try:
+        values = [int(value) for value in defined_name.attr_text.strip('{}').split(',')]
+    except ValueError:
+        return None
+    if len(values) != len(TOTAL_FIELDS):
+        return None
+    return FlightTotals(**dict(zip(TOTAL_FIELDS, values)))
+
+def write_carried_forward(wb, sheet_title, totals):
+    name = carried_forward_name(sheet_title)
+    values = ",".join(str(getattr(totals, field)) for field in TOTAL_FIELDS)
+    wb.defined_names[name] = DefinedName(name, attr_text=f"{{{values}}}", hidden=True)
+
+def update_carried_forward(wb, added, existing_sheets):
+    """Atualizar os totais acumulados das folhas depois de acrescentar voos.
+
+    added tem os totais dos voos acrescentados a cada folha e existing_sheets os nomes das folhas
+    que já existiam antes. Os totais escritos só recebem a soma do que foi acrescentado, sem
+    voltar a ler os voos; só uma folha de um logbook que ainda não os tem é lida (uma vez).
+    """
+    carried = FlightTotals()
+    delta = FlightTotals()
+    for sheet in wb.worksheets:
+        if sheet.title == TEMPLATE_SHEET_NAME:
+            continue
+        page_added = added.get(sheet.title, FlightTotals())
+        delta.merge(page_added)
+
+        previous = read_carried_forward(wb, sheet.title) if sheet.title in existing_sheets else None
+        if previous is not None:
+            carried = previous + delta
+            if not delta:
+                continue
+        elif sheet.title in existing_sheets:
+            page = FlightTotals()
+            for flight in sheet_flights(sheet):
+                page.add(flight)
+            carried = carried + page
+        else:
+            carried = carried + page_added
+        write_carried_forward(wb, sheet.title, carried)
+
+def clear_data_merges(sheet, rows=None):
+    """Desmesclar de uma só vez as células mescladas numa única linha da área de dados.
+
+    Se rows for dado, apenas essas linhas são desmescladas.
+    """
+    first_row, last_row = HEADER_ROW + 1, HEADER_ROW + MAX_FLIGHTS_PER_SHEET
+    row_merges = [
+        merged_range for merged_range in sheet.merged_cells.ranges
+        if merged_range.min_row == merged_range.max_row and first_row <= merged_range.min_row <= last_row
+        and (rows is None or merged_range.min_row in rows)
+    ]
+    for merged_range in row_merges:
+        # O mesmo que sheet.unmerge_cells, sem voltar a procurar o intervalo em todos os outros.
+        # Usa o Worksheet._cells do openpyxl 3.1 (fixado no requirements.txt; ver
+        # benchmarks/openpyxl_internals.py antes de mudar de versão)
+        sheet.merged_cells.remove(merged_range)
+        cells = merged_range.cells
+        next(cells)  # A primeira célula mantém o valor e o estilo
+        for coordinate in cells:
+            sheet._cells.pop(coordinate, None)
+
+def flight_row_values(flight_data, aircraft_data):
+    """Valores da linha de um voo no logbook, indexados pelo número da coluna."""
+    aircraft_info = aircraft_data.lookup(flight_data['aircraft_registration'])
+
+    return {
+        2: flight_data['date'],
+        3: flight_data['departure_airport'],
+        4: flight_data['departure_time'],
+        5: flight_data['arrival_airport'],
+        6: flight_data['arrival_time'],
+        7: aircraft_info['variant'],
+        8: flight_data['aircraft_registration'],
+        11: flight_data['flight_time'],
+        12: flight_data['flight_time'],
+        13: flight_data['captain'],
+        14: flight_data['takeoffs_day'],
+        15: flight_data['takeoffs_night'],
+        16: flight_data['landings_day'],
+        17: flight_data['landings_night'],
+        18: flight_data['night_flight_time'],
+        19: flight_data['ifr_time'],
+        21: flight_data['flight_time'],
+    }
+
 def add_flight_to_sheet(sheet, row, flight_data, aircraft_data):
-    """Adicionar dados de voo à linha dada na folha."""
-    registration_no_dash = flight_data['aircraft_registration'].replace("-", "").upper()
-    aircraft_info = aircraft_data.get(registration_no_dash, {'model': 'NA', 'variant': 'NA'})
-
-    # Desmesclar células na linha especificada
-    for merged_cell in sheet.merged_cells.ranges:
-        if merged_cell.min_row == row and merged_cell.max_row == row:
-            sheet.unmerge_cells(str(merged_cell))
-
-    sheet.cell(row=row, column=2, value=flight_data['date'])
-    sheet.cell(row=row, column=3, value=flight_data['departure_airport'])
-    sheet.cell(row=row, column=4, value=flight_data['departure_time'])
-    sheet.cell(row=row, column=5, value=flight_data['arrival_airport'])
-    sheet.cell(row=row, column=6, value=flight_data['arrival_time'])
-    sheet.cell(row=row, column=7, value=aircraft_info['variant'])
-    sheet.cell(row=row, column=8, value=flight_data['aircraft_registration'])
-    sheet.cell(row=row, column=11, value=flight_data['flight_time'])
-    sheet.cell(row=row, column=12, value=flight_data['flight_time'])
-    sheet.cell(row=row, column=13, value=flight_data['captain'])
-    sheet.cell(row=row, column=14, value=flight_data['takeoffs_day'])
-    sheet.cell(row=row, column=15, value=flight_data['takeoffs_night'])
-    sheet.cell(row=row, column=16, value=flight_data['landings_day'])
-    sheet.cell(row=row, column=17, value=flight_data['landings_night'])
-    sheet.cell(row=row, column=18, value=flight_data['night_flight_time'])
-    sheet.cell(row=row, column=19, value=flight_data['ifr_time'])
-    sheet.cell(row=row, column=21, value=flight_data['flight_time'])
+    """Adicionar dados de voo à linha dada na folha.
 
+    A linha já tem de estar desmesclada (ver clear_data_merges).
+    """
+    for column, value in flight_row_values(flight_data, aircraft_data).items():
+        sheet.cell(row=row, column=column, value=value)
+
+def copy_print_settings(source, target):
+    """Copiar as definições de página de source para target: orientação, papel, escala e ajustar à
+    página, margens, opções de impressão, área e títulos de impressão, quebras, cabeçalho e rodapé."""
+    target.sheet_properties = copy(source.sheet_properties)
+    target.sheet_format = copy(source.sheet_format)
+    # O page_setup de target fica ligado a target, de onde lê o ajustar à página (sheet_properties);
+    # o id é a relação com as definições da impressora, que só existe na folha de origem
+    for name in PrintPageSetup.__attrs__:
+        if name != 'id':
+            setattr(target.page_setup, name, getattr(source.page_setup, name))
+    target.page_margins = copy(source.page_margins)
+    target.print_options = copy(source.print_options)
+    target.HeaderFooter = copy(source.HeaderFooter)
+    target.row_breaks = copy(source.row_breaks)
+    target.col_breaks = copy(source.col_breaks)
+    target.print_title_rows = source.print_title_rows
+    target.print_title_cols = source.print_title_cols
+    target.print_area = source.print_area
 
 def create_new_sheet(wb):
     """Criar uma nova folha a partir da template."""
     new_sheet_index = len(wb.sheetnames)
     new_sheet_name = f"Sheet{new_sheet_index}"
-    new_sheet = wb.copy_worksheet(wb[TEMPLATE_SHEET_NAME])
+    template_sheet = wb[TEMPLATE_SHEET_NAME]
+    new_sheet = wb.copy_worksheet(template_sheet)
     new_sheet.title = new_sheet_name
+    # O copy_worksheet não copia o cabeçalho, o rodapé, os títulos nem a área de impressão
+    copy_print_settings(template_sheet, new_sheet)
+    clear_data_merges(new_sheet)
     return new_sheet
 
 def save_excel(wb, file_path):
     """Salvar o ficheiro Excel."""
-    wb.save(file_path)
+    with METRICS.stage('excel_save'):
+        wb.save(file_path)
+    METRICS.count('excel_bytes_saved', os.path.getsize(file_path))
+
+class TemplateStyles:
+    """Copiar estilos do template para um workbook write-only, traduzindo cada estilo distinto uma só vez."""
+
+    def __init__(self):
+        self.cache = {}
+
+    def cell(self, ws, source, value):
+        cell = WriteOnlyCell(ws, value)
+        if source.has_style:
+            # _style é o StyleArray do openpyxl 3.1 com os índices do estilo no workbook de origem
+            # (ver benchmarks/openpyxl_internals.py); só serve de chave, e o estilo copiado para
+            # o workbook novo é o _style de uma célula desse workbook
+            key = tuple(source._style)
+            style = self.cache.get(key)
+            if style is None:
+                cell.font = copy(source.font)
+                cell.border = copy(source.border)
+                cell.fill = copy(source.fill)
+                cell.number_format = source.number_format
+                cell.alignment = copy(source.alignment)
+                cell.protection = copy(source.protection)
+                self.cache[key] = copy(cell._style)
+            else:
+                cell._style = copy(style)
+        return cell
+
+def write_template_page(ws, template_sheet, styles, flights=None, aircraft_data=None):
+    """Escrever uma folha em streaming com o layout do template.
+
+    Sem flights é escrita uma cópia do próprio template; com flights os voos preenchem a área
+    de dados, que fica sem células mescladas tal como em create_new_sheet.
+    """
+    first_row, last_row = HEADER_ROW + 1, HEADER_ROW + MAX_FLIGHTS_PER_SHEET
+
+    # Dimensões e células mescladas têm de ser definidas antes de escrever as linhas
+    for key, dimension in template_sheet.column_dimensions.items():
+        ws.column_dimensions[key].width = dimension.width
+        ws.column_dimensions[key].hidden = dimension.hidden
+    for index, dimension in template_sheet.row_dimensions.items():
+        if dimension.height:
+            ws.row_dimensions[index].height = dimension.height
+    for merged_range in template_sheet.merged_cells.ranges:
+        in_data_area = merged_range.min_row == merged_range.max_row and first_row <= merged_range.min_row <= last_row
+        if flights is None or not in_data_area:
+            ws.merged_cells.add(merged_range.coord)
+    ws.freeze_panes = template_sheet.freeze_panes
+    copy_print_settings(template_sheet, ws)
+
+    flights = iter(flights or ())
+    max_column = max(template_sheet.max_column, 21)
+    for row in range(1, max(template_sheet.max_row, last_row) + 1):
+        values = {}
+        if first_row <= row <= last_row:
+            flight = next(flights, None)
+            if flight is not None:
+                values = flight_row_values(flight, aircraft_data)
+        cells = []
+        for column in range(1, max_column + 1):
+            source = template_sheet.cell(row=row, column=column)
+            cells.append(styles.cell(ws, source, values.get(column, source.value)))
+        ws.append(cells)
+
+def load_logbook_template(file_path):
+    """Folha template (Sheet0) de um logbook existente, com o layout e as definições de página, ou
+    None se o logbook não a tiver.
+
+    As outras folhas são trocadas por folhas vazias numa cópia em memória antes de a abrir, para
+    não ler todos os voos em modo normal.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        for relationship in relationships.iter(PACKAGE_RELATIONSHIP):
+            target = relationship.get('Target')
+            targets[relationship.get('Id')] = target.lstrip('/') if target.startswith('/') else posixpath.join('xl', target)
+        sheets = {sheet.get('name'): targets.get(sheet.get(RELATIONSHIP_ID))
+                  for sheet in workbook.iter(f"{SPREADSHEET_NS}sheet")}
+        if TEMPLATE_SHEET_NAME not in sheets:
+            return None
+        other_sheets = {part for name, part in sheets.items() if name != TEMPLATE_SHEET_NAME}
+
+        # Só o XML das outras folhas é trocado; as suas relações (comentários, desenhos, gráficos,
+        # tabelas) ficam no ficheiro e o openpyxl continua a lê-las e a ligá-las a essas folhas,
+        # agora vazias. Isto só é válido porque apenas a folha template é devolvida: nada do que
+        # pertence às outras folhas é usado nem volta a ser escrito.
+        stripped = io.BytesIO()
+        with zipfile.ZipFile(stripped, 'w', zipfile.ZIP_DEFLATED) as copy_archive:
+            for item in archive.infolist():
+                copy_archive.writestr(item, EMPTY_SHEET_XML if item.filename in other_sheets else archive.read(item))
+    return load_workbook(stripped)[TEMPLATE_SHEET_NAME]
+
+def write_logbook(file_path, flights, aircraft_data, template_path=TEMPLATE_PATH):
+    """Escrever o logbook completo em modo write-only, em páginas de MAX_FLIGHTS_PER_SHEET voos.
+
+    O layout vem da folha template do logbook existente (ou, sem ela, do ficheiro template_path),
+    para manter as alterações feitas pelo piloto. Os voos podem vir de um iterador; apenas uma
+    página é mantida em memória de cada vez.
+    """
+    template_sheet = load_logbook_template(file_path) if os.path.exists(file_path) else None
+    if template_sheet is None:
+        template_sheet = load_workbook(template_path)[TEMPLATE_SHEET_NAME]
+    styles = TemplateStyles()
+
+    wb = openpyxl.Workbook(write_only=True)
+    write_template_page(wb.create_sheet(TEMPLATE_SHEET_NAME), template_sheet, styles)
+
+    flights = iter(flights)
+    carried = FlightTotals()
+    page = 1
+    while True:
+        page_flights = list(islice(flights, MAX_FLIGHTS_PER_SHEET))
+        if not page_flights and page > 1:
+            break
+        for flight in page_flights:
+            carried.add(flight)
+        METRICS.count('excel_rows_written', len(page_flights))
+        write_template_page(wb.create_sheet(f"Sheet{page}"), template_sheet, styles, page_flights, aircraft_data)
+        write_carried_forward(wb, f"Sheet{page}", carried)
+        page += 1
+
+    # Escrever para um ficheiro temporário e só depois substituir o logbook
+    with METRICS.stage('excel_save'):
+        with replace_atomically(file_path) as file:
+            wb.save(file)
+    METRICS.count('excel_bytes_saved', os.path.getsize(file_path))
 
 def reorganize_logbook(file_path, csv_file_path):
-    wb = load_excel(file_path, 'logbook_template.xlsx')
     aircraft_data = load_aircraft_data(csv_file_path)
-    flights = get_all_flights(wb)
+
+    flights = []
+    if os.path.exists(file_path):
+        with METRICS.stage('excel_read'):
+            wb = load_workbook(file_path, read_only=True)
+            flights = get_all_flights(wb)
+            wb.close()
 
     # Ordenar voos por data e hora
-    for flight in flights:
-        flight['datetime'] = datetime.strptime(f"{flight['date']} {flight['departure_time']}", '%Y/%m/%d %H:%M')
-    flights.sort(key=lambda x: x['datetime'])
+    flights.sort(key=lambda x: datetime.strptime(f"{x['date']} {x['departure_time']}", '%Y/%m/%d %H:%M'))
 
-    # Remover todas as folhas, exceto a template
-    sheets_to_remove = [sheet for sheet in wb.worksheets if sheet.title != TEMPLATE_SHEET_NAME]
-    for sheet in sheets_to_remove:
-        wb.remove(sheet)
+    write_logbook(file_path, flights, aircraft_data)
 
-    # Adicionar os voos em novas folhas
-    current_sheet = create_new_sheet(wb)
-    current_row = HEADER_ROW + 1
+class OpenLogbook:
+    """Logbook mantido aberto em memória entre exportações, para o modo contínuo.
 
-    for flight in flights:
-        if current_row > MAX_FLIGHTS_PER_SHEET + HEADER_ROW:
-            current_sheet = create_new_sheet(wb)
-            current_row = HEADER_ROW + 1
+    O ficheiro só é lido na primeira exportação e de novo se for alterado fora do programa
+    (data de modificação diferente da do último save).
+    """
 
-        add_flight_to_sheet(current_sheet, current_row, flight, aircraft_data)
-        current_row += 1
+    def __init__(self, file_path, csv_file_path):
+        self.file_path = file_path
+        self.csv_file_path = csv_file_path
+        self.wb = None
+        self.allocator = None
+        self.mtime = None
 
-    save_excel(wb, file_path)
+    def open(self):
+        mtime = os.path.getmtime(self.file_path) if os.path.exists(self.file_path) else None
+        if self.wb is None or mtime != self.mtime:
+            with METRICS.stage('excel_load'):
+                self.wb = load_excel(self.file_path, TEMPLATE_PATH)
+                self.allocator = SheetAllocator(self.wb)
 
-def add_flights_to_excel(file_path, flights, csv_file_path):
-    wb = load_excel(file_path, '_internal/logbook_template.xlsx')
-    aircraft_data = load_aircraft_data(csv_file_path)
-    current_sheet = None
-    previous_sheet = None
-
-    # Encontrar uma folha existente com linhas disponíveis ou criar uma nova folha
-    for sheet in wb.worksheets:
-        if sheet.title != TEMPLATE_SHEET_NAME:
-            row = find_next_available_row(sheet)
-            if row is not None:
-                current_sheet = sheet
-                break
-
-    if current_sheet is None:
-        current_sheet = create_new_sheet(wb)
-    else:
-        previous_sheet = current_sheet
-
-    for flight in flights:
-        row = find_next_available_row(current_sheet)
-        if row is None:
-            previous_sheet = current_sheet
-            current_sheet = create_new_sheet(wb)
-            row = find_next_available_row(current_sheet)
-        add_flight_to_sheet(current_sheet, row, flight, aircraft_data)
-
-    save_excel(wb, file_path)
+    def add_flights(self, flights):
+        """Escrever os voos nas próximas linhas livres e guardar o ficheiro."""
+        self.open()
+        aircraft_data = load_aircraft_data(self.csv_file_path)
+        try:
+            existing_sheets = set(self.wb.sheetnames)
+            added = {}
+            for flight in flights:
+                sheet, row = self.allocator.next_row()
+                add_flight_to_sheet(sheet, row, flight, aircraft_data)
+                added.setdefault(sheet.title, FlightTotals()).add(flight)
+                METRICS.count('excel_rows_written')
+            update_carried_forward(self.wb, added, existing_sheets)
+            save_excel(self.wb, self.file_path)
+        except Exception:
+            # O workbook em memória já não corresponde ao ficheiro; volta a ser lido na próxima vez
+            self.wb = None
+            raise
+        self.mtime = os.path.getmtime(self.file_path)
 
+def add_flights_to_excel(file_path, flights, csv_file_path):
+    OpenLogbook(file_path, csv_file_path).add_flights(flights)
@@ -0,0 +1,262 @@
+"""Exportar os voos da DB para CSV (colunas do logbook EASA) ou para um formato colunar, sem passar pelo Excel.
+
+Os voos vêm do cursor ordenado da DB e são escritos à medida que chegam, por isso a memória
+não cresce com o tamanho do logbook. As colunas e os valores são os do logbook em Excel (ver
+excel_manager.flight_row_values), incluindo a variante da aeronave. O formato colunar é
+Parquet quando o pyarrow está instalado, ou NDJSON comprimido com gzip.
+
+Modos: todos os voos, um intervalo de datas (--start / --end) e incremental (--incremental: só
+os voos guardados desde a última exportação para o mesmo ficheiro, acrescentados ao ficheiro).
+
+Uso: python export.py SAIDA [--format csv|ndjson|parquet] [--start AAAA-MM-DD] [--end AAAA-MM-DD]
+                       [--incremental] [--tenant PILOTO]
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from itertools import chain
+from dotenv import load_dotenv
+from aircraft_registry import get_aircraft_registry
+from atomic_file import replace_atomically
+from database import get_client, get_database, get_state_collection, close_client, iter_flights, get_export_mark, set_export_mark
+from excel_manager import flight_row_values
+from metrics import METRICS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Colunas do logbook EASA: (coluna na folha do logbook, nome no ficheiro exportado)
+EASA_COLUMNS = (
+    (2, 'date'),
+    (3, 'departure_place'),
+    (4, 'departure_time'),
+    (5, 'arrival_place'),
+    (6, 'arrival_time'),
+    (7, 'aircraft_type'),
+    (8, 'aircraft_registration'),
+    (11, 'multi_pilot_time'),
+    (12, 'total_time'),
+    (13, 'pic_name'),
+    (14, 'takeoffs_day'),
+    (15, 'takeoffs_night'),
+    (16, 'landings_day'),
+    (17, 'landings_night'),
+    (18, 'night_time'),
+    (19, 'ifr_time'),
+    (21, 'copilot_time'),
+)
+COLUMN_NAMES = [name for _, name in EASA_COLUMNS]
+INTEGER_COLUMNS = ('takeoffs_day', 'takeoffs_night', 'landings_day', 'landings_night')
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+# Voos pedidos à DB por lote e linhas por row group do Parquet (o que fica em memória de cada vez)
+CURSOR_BATCH_SIZE = 5000
+ROW_GROUP_SIZE = 50000
+
+# Nível do gzip: o 9 (por omissão) demora o dobro para ficheiros só 6% mais pequenos
+GZIP_LEVEL = 6
+
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+def columnar_format():
+    """Formato colunar disponível: Parquet com o pyarrow, senão NDJSON comprimido."""
+    return 'parquet' if pyarrow is not None else 'ndjson'
+
+def format_from_path(path):
+    """Formato a partir da extensão do ficheiro (.csv, .ndjson/.jsonl com ou sem .gz, .parquet)."""
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.parquet'):
+        return 'parquet'
+    return columnar_format()
+
+def easa_rows(flights, aircraft_data):
+    """Linhas do logbook EASA (listas de valores pela ordem de COLUMN_NAMES), uma por voo."""
+    for flight in flights:
+        values = flight_row_values(flight, aircraft_data)
+        yield [values[column] for column, _ in EASA_COLUMNS]
+
+def write_csv(rows, file, header=True):
+    writer = csv.writer(file)
+    if header:
+        writer.writerow(COLUMN_NAMES)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_ndjson(rows, file):
+    count = 0
+    for row in rows:
+        file.write(_encode_json(dict(zip(COLUMN_NAMES, row))) + '\n')
+        count += 1
+    return count
+
+def parquet_schema():
+    return pyarrow.schema([(name, pyarrow.int64() if name in INTEGER_COLUMNS else pyarrow.string()) for name in COLUMN_NAMES])
+
+def write_parquet(rows, where):
+    """Escrever as linhas em Parquet (where é um caminho ou um ficheiro binário aberto), um row group
+    de ROW_GROUP_SIZE linhas de cada vez."""
+    schema = parquet_schema()
+    count = 0
+    with pyarrow.parquet.ParquetWriter(where, schema) as writer:
+        columns = [[] for _ in COLUMN_NAMES]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            count += 1
+            if len(columns[0]) >= ROW_GROUP_SIZE:
+                writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+                columns = [[] for _ in COLUMN_NAMES]
+        if columns[0] or count == 0:
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+    return count
+
+def is_compressed(path, file_format):
+    """Comprimir com gzip os ficheiros .gz e o NDJSON, a não ser que o nome termine em .ndjson ou .jsonl."""
+    name = path.lower()
+    return name.endswith('.gz') or (file_format == 'ndjson' and not name.endswith(('.ndjson', '.jsonl')))
+
+def write_text(rows, binary_file, file_format, compressed, header=True):
+    """Escrever as linhas em texto (UTF-8) no ficheiro binário já aberto, comprimido ou não."""
+    if compressed:
+        file = gzip.open(binary_file, 'wt', compresslevel=GZIP_LEVEL, newline='', encoding='utf-8')
+    else:
+        file = io.TextIOWrapper(binary_file, newline='', encoding='utf-8')
+    with file:
+        if file_format == 'csv':
+            return write_csv(rows, file, header)
+        return write_ndjson(rows, file)
+
+def check_parquet_target(path, append):
+    """Recusar um caminho Parquet criado no outro modo: a exportação completa escreve um único
+    ficheiro e a incremental uma pasta com uma parte por exportação."""
+    if append and os.path.isfile(path):
+        raise ValueError(f"{path} é um ficheiro Parquet de uma exportação completa e a exportação incremental "
+                         f"escreve uma pasta: use outro caminho ou apague o ficheiro")
+    if not append and os.path.isdir(path):
+        raise ValueError(f"{path} é a pasta de uma exportação incremental em Parquet e a exportação completa "
+                         f"escreve um único ficheiro: use outro caminho ou apague a pasta")
+
+def write_rows(rows, path, file_format, append=False):
+    """Escrever as linhas no ficheiro. Sem append o ficheiro é substituído de forma atómica no fim;
+    com append as linhas são acrescentadas (no Parquet, num ficheiro novo dentro da pasta path)."""
+    if file_format == 'parquet':
+        if pyarrow is None:
+            raise ValueError("O formato Parquet precisa do pyarrow (pip install pyarrow); use --format ndjson")
+        if append:
+            # Um Parquet não pode ser acrescentado: cada exportação incremental é uma parte do dataset
+            os.makedirs(path, exist_ok=True)
+            return write_parquet(rows, os.path.join(path, f"part-{time.time_ns()}.parquet"))
+
+    compressed = is_compressed(path, file_format)
+    if append:
+        # Num .gz as linhas novas ficam num membro gzip novo no fim do ficheiro, que continua válido
+        header = not (os.path.exists(path) and os.path.getsize(path) > 0)
+        with open(path, 'ab') as file:
+            return write_text(rows, file, file_format, compressed, header)
+
+    with replace_atomically(path) as file:
+        if file_format == 'parquet':
+            return write_parquet(rows, file)
+        return write_text(rows, file, file_format, compressed)
+
+def export_flights(flights_collection, path, file_format=None, start=None, end=None, state_collection=None, aircraft_data=None):
+    """Exportar os voos para path, ordenados por data e hora.
+
+    start e end (datetime, end excluído) limitam o intervalo. Com state_collection a exportação é
+    incremental: só os voos guardados depois da última exportação para path são acrescentados ao
+    ficheiro (no Parquet, path é uma pasta com uma parte por exportação) e a marca avança no fim.
+    Devolve o número de voos exportados.
+    """
+    file_format = file_format or format_from_path(path)
+    if aircraft_data is None:
+        aircraft_data = get_aircraft_registry()
+    target = os.path.abspath(path)
+
+    last_exported = None
+    if state_collection is not None and os.path.exists(path):
+        last_exported = get_export_mark(state_collection, target)
+    if file_format == 'parquet':
+        append = state_collection is not None
+        check_parquet_target(path, append)
+    else:
+        append = last_exported is not None
+
+    newest = None
+
+    def track(flights):
+        nonlocal newest
+        for flight in flights:
+            if newest is None or flight['_id'] > newest['_id']:
+                newest = flight
+            yield flight
+
+    flights = iter_flights(flights_collection, start, end, after_id=last_exported,
+                           include_id=True, batch_size=CURSOR_BATCH_SIZE)
+    rows = easa_rows(track(flights), aircraft_data)
+    first = next(rows, None)
+    if first is None and append:
+        logging.info(f"Sem voos novos para exportar para {path}")
+        return 0
+
+    with METRICS.stage('file_export'):
+        count = write_rows(chain([first], rows) if first is not None else rows, path, file_format, append)
+    METRICS.count('file_rows_written', count)
+
+    if state_collection is not None and newest is not None:
+        set_export_mark(state_collection, target, newest['_id'], newest['datetime'])
+    logging.info(f"{count} voos exportados para {path} ({file_format})")
+    return count
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar os voos da DB para CSV (colunas EASA), NDJSON comprimido ou Parquet")
+    parser.add_argument("output", help="ficheiro de saída (.csv, .ndjson.gz ou .parquet)")
+    parser.add_argument("--format", choices=FORMATS + ('columnar',), help="formato (por omissão, pela extensão); columnar = Parquet se o pyarrow estiver instalado, senão NDJSON")
+    parser.add_argument("--start", type=parse_date, help="primeiro dia a exportar (AAAA-MM-DD)")
+    parser.add_argument("--end", type=parse_date, help="último dia a exportar, incluído (AAAA-MM-DD)")
+    parser.add_argument("--incremental", action="store_true", help="só os voos novos desde a última exportação para o mesmo ficheiro")
+    parser.add_argument("--tenant", help="piloto do roster (coleções flights.<piloto>)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(filename='logbook_creator.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    file_format = columnar_format() if args.format == 'columnar' else args.format
+    end = args.end + timedelta(days=1) if args.end else None
+    start_time = time.perf_counter()
+    try:
+        client = get_client()
+        flights_collection = get_database(client, args.tenant)
+        state_collection = get_state_collection(client, args.tenant) if args.incremental else None
+        count = export_flights(flights_collection, args.output, file_format, args.start, end, state_collection)
+    except ValueError as e:
+        print(f"Falha ao exportar os voos: {e}")
+        sys.exit(1)
+    finally:
+        close_client()
+    print(f"{count} voos exportados para {args.output} em {time.perf_counter() - start_time:.1f}s")
+
+if __name__ == "__main__":
+    main()
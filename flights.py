@@ -1,31 +1,183 @@
 import os
 import re
 import csv
-from datetime import datetime
-from suntime import Sun
+import pickle
+import logging
+from datetime import datetime, timedelta
+from atomic_file import replace_atomically
+from sun_times import SolarTimesCache
+from night_time import compute_night_minutes, flight_duration_minutes, format_minutes, parse_minutes
+from aircraft_registry import get_aircraft_registry
 import sys
 
-# Carregar os dados do CSV para um dicionário
-def load_iata_to_icao_coords():
-    iata_to_icao_coords = {}
+AIRPORTS_CSV = '_internal/iata_to_icao_coords.csv'
+AIRPORTS_PICKLE = '_internal/iata_to_icao_coords.pickle'
+
+# Formato do ficheiro pré-gerado: a tabela com a versão e a origem dos dados (ver airport_update.py)
+AIRPORTS_FORMAT = 1
+
+def get_base_path():
     base_path = os.path.abspath(".")
     if getattr(sys, 'frozen', False):
         # Running in a bundle
         base_path = os.path.dirname(sys.executable)
-    csv_file_path = os.path.join(base_path, '_internal/iata_to_icao_coords.csv')
+    return base_path
+
+# Carregar os dados do CSV para um dicionário
+def load_iata_to_icao_coords(csv_file_path=None):
+    """Ler o CSV de aeroportos para um dicionário IATA -> (ICAO, latitude, longitude)."""
+    iata_to_icao_coords = {}
+    if csv_file_path is None:
+        csv_file_path = os.path.join(get_base_path(), AIRPORTS_CSV)
 
     with open(csv_file_path, mode='r') as infile:
         reader = csv.reader(infile)
         next(reader)  # Skip header
         for rows in reader:
-            iata_to_icao_coords[rows[0]] = {'icao': rows[1], 'latitude': float(rows[2]), 'longitude': float(rows[3])}
+            iata_to_icao_coords[rows[0]] = (rows[1], float(rows[2]), float(rows[3]))
     return iata_to_icao_coords
 
-# Carregar o dicionário IATA para ICAO e coordenadas
-IATA_TO_ICAO_COORDS = load_iata_to_icao_coords()
+def write_airports_pickle(iata_to_icao_coords, pickle_file_path, version=0, **metadata):
+    """Guardar a tabela de aeroportos no formato binário lido por load_airports, substituindo o ficheiro de forma atómica.
+
+    metadata guarda a origem dos dados (ex: URL, ETag e Last-Modified do download).
+    """
+    artifact = {'format': AIRPORTS_FORMAT, 'version': version, **metadata, 'airports': iata_to_icao_coords}
+    with replace_atomically(pickle_file_path) as file:
+        pickle.dump(artifact, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_airports_pickle(pickle_file_path):
+    """Ler o ficheiro pré-gerado: dicionário com 'version', os metadados da origem e a tabela em 'airports'."""
+    with open(pickle_file_path, 'rb') as file:
+        artifact = pickle.load(file)
+    if artifact.get('format') != AIRPORTS_FORMAT:
+        # Formato antigo: só a tabela
+        artifact = {'format': AIRPORTS_FORMAT, 'version': 0, 'airports': artifact}
+    return artifact
+
+def load_airports_artifact():
+    """Carregar a tabela de aeroportos e a sua versão.
+
+    O pickle com versão (gerado pelo airport_update.py) é a fonte da tabela; sem ele lê-se o CSV,
+    como versão 0. Só há leituras: o pickle nunca é gerado aqui, para não competir com uma atualização.
+    """
+    base_path = get_base_path()
+    try:
+        return read_airports_pickle(os.path.join(base_path, AIRPORTS_PICKLE))
+    except FileNotFoundError:
+        pass
+    iata_to_icao_coords = load_iata_to_icao_coords(os.path.join(base_path, AIRPORTS_CSV))
+    return {'format': AIRPORTS_FORMAT, 'version': 0, 'airports': iata_to_icao_coords}
+
+def load_airports():
+    """Carregar a tabela de aeroportos IATA -> (ICAO, latitude, longitude)."""
+    return load_airports_artifact()['airports']
+
+def airports_stamp():
+    """Ficheiro de onde a tabela é lida (o pickle ou, sem ele, o CSV), com o seu inode e data de
+    modificação, ou None se nenhum existir. Muda sempre que o ficheiro é substituído."""
+    base_path = get_base_path()
+    for name in (AIRPORTS_PICKLE, AIRPORTS_CSV):
+        path = os.path.join(base_path, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return path, stat.st_ino, stat.st_mtime_ns
+    return None
+
+# Tabela IATA -> (ICAO, latitude, longitude) e índice ICAO -> IATA, carregados apenas na primeira consulta
+IATA_TO_ICAO_COORDS = None
+ICAO_TO_IATA = None
+
+# Versão da tabela carregada e o ficheiro de onde foi lida (ver airports_stamp)
+AIRPORTS_VERSION = None
+AIRPORTS_STAMP = None
+
+def reload_airport_table():
+    global IATA_TO_ICAO_COORDS, ICAO_TO_IATA, AIRPORTS_VERSION, AIRPORTS_STAMP
+    # Lido antes da tabela, para que uma substituição durante a leitura seja vista na verificação seguinte
+    AIRPORTS_STAMP = airports_stamp()
+    artifact = load_airports_artifact()
+    IATA_TO_ICAO_COORDS = artifact['airports']
+    ICAO_TO_IATA = None
+    AIRPORTS_VERSION = artifact['version']
+    return IATA_TO_ICAO_COORDS
+
+def get_airport_table():
+    if IATA_TO_ICAO_COORDS is None:
+        return reload_airport_table()
+    return IATA_TO_ICAO_COORDS
+
+def refresh_airport_table():
+    """Voltar a carregar a tabela se o ficheiro de aeroportos foi substituído (ex: pelo airport_update.py).
+
+    Permite que um processo em execução use uma tabela nova sem reiniciar; custa um stat.
+    """
+    if IATA_TO_ICAO_COORDS is None or airports_stamp() == AIRPORTS_STAMP:
+        return get_airport_table()
+    previous_version = AIRPORTS_VERSION
+    reload_airport_table()
+    logging.info(f"Tabela de aeroportos recarregada: versão {previous_version} -> {AIRPORTS_VERSION}, "
+                 f"{len(IATA_TO_ICAO_COORDS)} aeroportos")
+    return IATA_TO_ICAO_COORDS
+
+# Cache de nascer/pôr do sol por (aeroporto, data), partilhada por todos os emails do processo
+SOLAR_TIMES = SolarTimesCache()
+
+# Padrões compilados uma única vez para o parser dos emails
+DATE_PATTERN = re.compile(r'(\d{4}/\d{2}/\d{2})')
+CAPTAIN_PATTERN = re.compile(r'Flight Deck Crew\s+\w+\s+:\s+CP\s+:\s+([A-Z\s]+)')
+# Entre o nome do campo, os dois pontos e o valor só há espaços da mesma linha: um campo em
+# branco não pode levar o nome do campo seguinte como valor
+FLIGHT_FIELDS_PATTERN = re.compile(
+    r'FlightNumber[^\S\n]+:[^\S\n]+(?P<flight_number>\w+)'
+    r'|City Pair[^\S\n]+:[^\S\n]+(?P<city_pair>\w+ - \w+)'
+    r'|Airborne[^\S\n]+:[^\S\n]+(?P<airborne>\d{2}:\d{2})'
+    r'|Landed[^\S\n]+:[^\S\n]+(?P<landed>\d{2}:\d{2})'
+    r'|Registration[^\S\n]+:[^\S\n]+(?P<registration>\w+)'
+    r'|Total flight[^\S\n]+:[^\S\n]+(?P<total_flight>\d{2}:\d{2})'
+    r'|Take Offs Day[^\S\n]+:[^\S\n]+(?P<takeoffs_day>\d+)'
+    r'|Take Offs Night[^\S\n]+:[^\S\n]+(?P<takeoffs_night>\d+)'
+    r'|Landings Day[^\S\n]+:[^\S\n]+(?P<landings_day>\d+)'
+    r'|Landings Night[^\S\n]+:[^\S\n]+(?P<landings_night>\d+)'
+    r'|Night Flight Time[^\S\n]+:[^\S\n]+(?P<night_flight_time>\d{2}:\d{2})'
+    r'|IFR Time[^\S\n]+:[^\S\n]+(?P<ifr_time>\d{2}:\d{2})'
+)
+
+# Campos de um voo na DB, pela ordem de Flight.to_dict
+FLIGHT_FIELDS = ('date', 'departure_airport', 'arrival_airport', 'departure_time', 'arrival_time',
+                 'aircraft_registration', 'aircraft_type', 'flight_time', 'captain', 'takeoffs_day',
+                 'takeoffs_night', 'landings_day', 'landings_night', 'night_flight_time', 'ifr_time', 'datetime')
+
+# Textos 'HH:MM' e IFR pré-calculados para as durações até 48h, para serializar voos sem formatar cada um
+HHMM_TEXT = [format_minutes(minutes) for minutes in range(48 * 60)]
+IFR_TEXT = [f"{minutes // 60}:{minutes % 60:02d}" for minutes in range(24 * 60)]
+
+def format_flight_minutes(minutes):
+    """Tempo de voo ou noturno como é guardado na DB ('HH:MM'), pela tabela quando possível."""
+    return HHMM_TEXT[minutes] if minutes < 48 * 60 else format_minutes(minutes)
+
+def format_ifr_minutes(minutes):
+    """Tempo IFR como sempre foi guardado na DB: str(timedelta) sem os segundos (ex: '1:05').
+
+    Um voo que passa a meia-noite dá um valor negativo, guardado como '-1 day, 22:30'.
+    """
+    if 0 <= minutes < 24 * 60:
+        return IFR_TEXT[minutes]
+    return str(timedelta(minutes=minutes))[:-3]
 
 class Flight:
-    def __init__(self, date, departure_airport, arrival_airport, departure_time, arrival_time, aircraft_registration, aircraft_type, flight_time, captain, takeoffs_day, takeoffs_night, landings_day, landings_night, night_flight_time, ifr_time):
+    """Voo lido de um email.
+
+    As durações são minutos inteiros e datetime (descolagem) vem já calculado pelo parser.
+    to_dict devolve os mesmos campos e formatos de sempre ('HH:MM'), prontos para o MongoDB.
+    """
+    __slots__ = ('date', 'departure_airport', 'arrival_airport', 'departure_time', 'arrival_time',
+                 'aircraft_registration', 'aircraft_type', 'flight_minutes', 'captain', 'takeoffs_day',
+                 'takeoffs_night', 'landings_day', 'landings_night', 'night_minutes', 'ifr_minutes', 'datetime')
+
+    def __init__(self, date, departure_airport, arrival_airport, departure_time, arrival_time, aircraft_registration, aircraft_type, flight_minutes, captain, takeoffs_day, takeoffs_night, landings_day, landings_night, night_minutes, ifr_minutes, datetime):
         self.date = date
         self.departure_airport = departure_airport
         self.arrival_airport = arrival_airport
@@ -33,16 +185,28 @@ class Flight:
         self.arrival_time = arrival_time
         self.aircraft_registration = aircraft_registration
         self.aircraft_type = aircraft_type
-        self.flight_time = flight_time
+        self.flight_minutes = flight_minutes
         self.captain = captain
         self.takeoffs_day = takeoffs_day
         self.takeoffs_night = takeoffs_night
         self.landings_day = landings_day
         self.landings_night = landings_night
-        self.night_flight_time = night_flight_time
-        self.ifr_time = ifr_time
-        self.datetime = datetime.strptime(f"{self.date} {self.departure_time}", '%Y/%m/%d %H:%M')
-    
+        self.night_minutes = night_minutes
+        self.ifr_minutes = ifr_minutes
+        self.datetime = datetime
+
+    @property
+    def flight_time(self):
+        return format_flight_minutes(self.flight_minutes)
+
+    @property
+    def night_flight_time(self):
+        return format_flight_minutes(self.night_minutes)
+
+    @property
+    def ifr_time(self):
+        return format_ifr_minutes(self.ifr_minutes)
+
     def to_dict(self):
         return {
             'date': self.date,
@@ -52,123 +216,168 @@ class Flight:
             'arrival_time': self.arrival_time,
             'aircraft_registration': self.aircraft_registration,
             'aircraft_type': self.aircraft_type,
-            'flight_time': self.flight_time,
+            'flight_time': format_flight_minutes(self.flight_minutes),
             'captain': self.captain,
             'takeoffs_day': self.takeoffs_day,
             'takeoffs_night': self.takeoffs_night,
             'landings_day': self.landings_day,
             'landings_night': self.landings_night,
-            'night_flight_time': self.night_flight_time,
-            'ifr_time': self.ifr_time,
+            'night_flight_time': format_flight_minutes(self.night_minutes),
+            'ifr_time': format_ifr_minutes(self.ifr_minutes),
             'datetime': self.datetime
         }
 
+    def __repr__(self):
+        return f"Flight({self.to_dict()})"
+
 def convert_iata_to_icao(iata_code):
-    return IATA_TO_ICAO_COORDS.get(iata_code, {'icao': iata_code})['icao']
+    airport = get_airport_table().get(iata_code)
+    return airport[0] if airport else iata_code
+
+def is_known_airport(iata_code):
+    return iata_code in get_airport_table()
 
 def get_airport_coordinates(iata_code):
-    return IATA_TO_ICAO_COORDS.get(iata_code, {'latitude': 0.0, 'longitude': 0.0})
+    airport = get_airport_table().get(iata_code)
+    if airport is None:
+        return {'latitude': 0.0, 'longitude': 0.0}
+    return {'latitude': airport[1], 'longitude': airport[2]}
+
+def get_airport_position(iata_code):
+    """(latitude, longitude) do aeroporto, ou (0.0, 0.0) se for desconhecido."""
+    airport = get_airport_table().get(iata_code)
+    return (airport[1], airport[2]) if airport else (0.0, 0.0)
+
+def convert_icao_to_iata(icao_code):
+    """Código IATA a partir do código ICAO guardado na DB, ou None se for desconhecido."""
+    global ICAO_TO_IATA
+    if ICAO_TO_IATA is None:
+        ICAO_TO_IATA = {airport[0]: iata_code for iata_code, airport in get_airport_table().items()}
+    return ICAO_TO_IATA.get(icao_code)
+
+def get_airport_by_icao(icao_code):
+    """(IATA, (latitude, longitude)) a partir do código ICAO guardado na DB, ou None se for desconhecido."""
+    iata_code = convert_icao_to_iata(icao_code)
+    return (iata_code, get_airport_position(iata_code)) if iata_code else None
 
 def is_night_time(time, sunrise, sunset):
     return time < sunrise or time > sunset
 
 def extract_captain_name(email_body):
-    match = re.search(r'Flight Deck Crew\s+\w+\s+:\s+CP\s+:\s+([A-Z\s]+)', email_body)
+    match = CAPTAIN_PATTERN.search(email_body)
     if match:
         captain_name = match.group(1).strip().split('\n')[0]  # Split at new line and take the first part
         return captain_name
     return "N/A"
 
 def load_aircraft_data():
-    """Carregar dados das aeronaves do ficheiro CSV."""
-    aircraft_data = {}
-    base_path = os.path.abspath(".")
-    if getattr(sys, 'frozen', False):
-        # Running in a bundle
-        base_path = os.path.dirname(sys.executable)
-    csv_file_path = os.path.join(base_path, '_internal/ryanair_aircrafts.csv')
-
-    with open(csv_file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            registration = row['Registration'].replace("-", "").upper()
-            aircraft_data[registration] = {
-                'model': row['Aircraft Type'],
-                'variant': 'B737-800' if '737-800' in row['Aircraft Type'] else 'B737-8200' if 'MAX 8' in row['Aircraft Type'] else 'NA'
-            }
-    return aircraft_data
-
-def create_flight_from_email(email_body, aircraft_data):
+    """Registo partilhado das aeronaves (o CSV só é lido de novo se for alterado)."""
+    return get_aircraft_registry()
+
+def parse_time(value):
+    """Converter 'HH:MM' num timedelta desde a meia-noite."""
+    hours, minutes = value.split(':')
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+def parse_flight_sections(email_body):
+    """Extrair os campos de cada secção de voo numa única passagem pelo corpo do email.
+
+    Cada secção começa num 'FlightNumber'; dentro de cada secção conta a primeira ocorrência de cada campo.
+    """
+    sections = []
+    fields = None
+    for match in FLIGHT_FIELDS_PATTERN.finditer(email_body):
+        field = match.lastgroup
+        if field == 'flight_number':
+            fields = {'flight_number': match.group(field)}
+            sections.append(fields)
+        elif fields is not None and field not in fields:
+            fields[field] = match.group(field)
+    return sections
+
+def create_flight_from_email(email_body, aircraft_data=None):
+    if aircraft_data is None:
+        aircraft_data = get_aircraft_registry()
+    refresh_airport_table()
     flights = []
-    date_match = re.search(r'(\d{4}/\d{2}/\d{2})', email_body)
+    date_match = DATE_PATTERN.search(email_body)
     date = date_match.group(1) if date_match else None
     if not date:
         print("Data não encontrada no corpo do email.")
         return flights
-    
-    flight_sections = re.split(r'(FlightNumber\s+:\s+\w+)', email_body)[1:]  # Split and remove first empty element
-    flight_sections = [''.join(flight_sections[i:i+2]) for i in range(0, len(flight_sections), 2)]  # Join headers with content
 
     captain_name = extract_captain_name(email_body)
+    year, month, day = date.split('/')
+    date_obj = datetime(int(year), int(month), int(day))
 
-    for section in flight_sections:
-        # Debug only.
-        # print(f"Processando seção de voo: {section[:100]}...")
-        
-        city_pair_match = re.search(r'City Pair\s+:\s+(\w+) - (\w+)', section)
-        departure_time_match = re.search(r'Airborne\s+:\s+(\d{2}:\d{2})', section)
-        arrival_time_match = re.search(r'Landed\s+:\s+(\d{2}:\d{2})', section)
-        aircraft_registration_match = re.search(r'Registration\s+:\s+(\w+)', section)
-        flight_time_match = re.search(r'Total flight\s+:\s+(\d{2}:\d{2})', section)
-        takeoffs_day_match = re.search(r'Take Offs Day\s+:\s+(\d+)', section)
-        takeoffs_night_match = re.search(r'Take Offs Night\s+:\s+(\d+)', section)
-        landings_day_match = re.search(r'Landings Day\s+:\s+(\d+)', section)
-        landings_night_match = re.search(r'Landings Night\s+:\s+(\d+)', section)
-        night_flight_time_match = re.search(r'Night Flight Time\s+:\s+(\d{2}:\d{2})', section)
-        ifr_time_match = re.search(r'IFR Time\s+:\s+(\d{2}:\d{2})', section)
-
-        if not city_pair_match or not departure_time_match or not arrival_time_match:
+    sections = []
+    for fields in parse_flight_sections(email_body):
+        if 'city_pair' not in fields or 'airborne' not in fields or 'landed' not in fields:
             # Debug only:
-            # print(f"Pulando secção devido a dados ausentes: {section[:100]}...")
+            # print(f"Pulando secção devido a dados ausentes: {fields}")
             continue
+        sections.append(fields)
+
+    # Route of each flight: both airports, takeoff and landing times
+    departure_iatas, arrival_iatas, takeoffs, durations = [], [], [], []
+    for fields in sections:
+        departure_airport_iata, arrival_airport_iata = fields['city_pair'].split(' - ')
+        departure_iatas.append(departure_airport_iata)
+        arrival_iatas.append(arrival_airport_iata)
+        takeoffs.append(date_obj + parse_time(fields['airborne']))
+        durations.append(flight_duration_minutes(fields['airborne'], fields['landed']))
+    landings = [takeoff + timedelta(minutes=duration) for takeoff, duration in zip(takeoffs, durations)]
+
+    # Calculate sunrise and sunset times for every departure and arrival of the email at once
+    sun_times = SOLAR_TIMES.get_many(
+        [(iata, takeoff, get_airport_position(iata)) for iata, takeoff in zip(departure_iatas, takeoffs)]
+        + [(iata, landing, get_airport_position(iata)) for iata, landing in zip(arrival_iatas, landings)]
+    )
+    departure_sun_times, arrival_sun_times = sun_times[:len(sections)], sun_times[len(sections):]
 
+    # Night time integrated along the great-circle route, for flights with both airports known
+    known = [index for index in range(len(sections))
+             if is_known_airport(departure_iatas[index]) and is_known_airport(arrival_iatas[index])]
+    night_minutes = {}
+    if known:
+        minutes = compute_night_minutes(
+            [get_airport_position(departure_iatas[index]) for index in known],
+            [get_airport_position(arrival_iatas[index]) for index in known],
+            [takeoffs[index] for index in known],
+            [durations[index] for index in known],
+        )
+        night_minutes = dict(zip(known, minutes.tolist()))
+
+    for index, fields in enumerate(sections):
         # Handle missing data
-        departure_airport_iata = city_pair_match.group(1)
-        arrival_airport_iata = city_pair_match.group(2)
-        departure_airport = convert_iata_to_icao(departure_airport_iata)
-        arrival_airport = convert_iata_to_icao(arrival_airport_iata)
-        departure_time = departure_time_match.group(1)
-        arrival_time = arrival_time_match.group(1)
-        aircraft_registration = aircraft_registration_match.group(1) if aircraft_registration_match else "N/A"
-        flight_time = flight_time_match.group(1) if flight_time_match else "00:00"
-        takeoffs_day = int(takeoffs_day_match.group(1)) if takeoffs_day_match else 0
-        takeoffs_night = int(takeoffs_night_match.group(1)) if takeoffs_night_match else 0
-        landings_day = int(landings_day_match.group(1)) if landings_day_match else 0
-        landings_night = int(landings_night_match.group(1)) if landings_night_match else 0
-        night_flight_time = night_flight_time_match.group(1) if night_flight_time_match else "00:00"
+        departure_airport = convert_iata_to_icao(departure_iatas[index])
+        arrival_airport = convert_iata_to_icao(arrival_iatas[index])
+        departure_time = fields['airborne']
+        arrival_time = fields['landed']
+        aircraft_registration = fields.get('registration', "N/A")
+        flight_minutes = parse_minutes(fields.get('total_flight', "00:00"))
+
+        # Night time from the route when both airports are known, otherwise the value in the email
+        if index in night_minutes:
+            night_flight_minutes = night_minutes[index]
+        else:
+            night_flight_minutes = parse_minutes(fields.get('night_flight_time', "00:00"))
 
         # Calculate IFR time as the difference between arrival and departure times
-        departure_time_obj = datetime.strptime(departure_time, "%H:%M")
-        arrival_time_obj = datetime.strptime(arrival_time, "%H:%M")
-        ifr_time_delta = arrival_time_obj - departure_time_obj
-        ifr_time = str(ifr_time_delta)[:-3]
-
-        # Calculate sunrise and sunset times
-        coordinates = get_airport_coordinates(departure_airport_iata)
-        sun = Sun(coordinates['latitude'], coordinates['longitude'])
-        date_obj = datetime.strptime(date, "%Y/%m/%d")
-        sunrise = sun.get_sunrise_time(date_obj).time()
-        sunset = sun.get_sunset_time(date_obj).time()
-
-        # Determine if the takeoff and landing were during day or night
-        takeoffs_day = 1 if not is_night_time(departure_time_obj.time(), sunrise, sunset) else 0
-        takeoffs_night = 1 if is_night_time(departure_time_obj.time(), sunrise, sunset) else 0
-        landings_day = 1 if not is_night_time(arrival_time_obj.time(), sunrise, sunset) else 0
-        landings_night = 1 if is_night_time(arrival_time_obj.time(), sunrise, sunset) else 0
-
-        # Obter o tipo de aeronave a partir dos dados de aeronaves
-        registration_no_dash = aircraft_registration.replace("-", "").upper()
-        aircraft_type = aircraft_data.get(registration_no_dash, {'model': 'NA'})['model']
+        ifr_minutes = parse_minutes(arrival_time) - parse_minutes(departure_time)
+
+        # Takeoff against the departure airport's sun times, landing against the arrival airport's
+        sunrise, sunset = departure_sun_times[index]
+        takeoff_at_night = is_night_time(takeoffs[index].time(), sunrise, sunset)
+        sunrise, sunset = arrival_sun_times[index]
+        landing_at_night = is_night_time(landings[index].time(), sunrise, sunset)
+        takeoffs_day = 0 if takeoff_at_night else 1
+        takeoffs_night = 1 if takeoff_at_night else 0
+        landings_day = 0 if landing_at_night else 1
+        landings_night = 1 if landing_at_night else 0
+
+        # Obter o tipo de aeronave a partir do registo de aeronaves
+        aircraft_type = aircraft_data.lookup(aircraft_registration)['model']
 
         flight = Flight(
             date=date,
@@ -178,14 +387,15 @@ def create_flight_from_email(email_body, aircraft_data):
             arrival_time=arrival_time,
             aircraft_registration=aircraft_registration,
             aircraft_type=aircraft_type,
-            flight_time=flight_time,
+            flight_minutes=flight_minutes,
             captain=captain_name,
             takeoffs_day=takeoffs_day,
             takeoffs_night=takeoffs_night,
             landings_day=landings_day,
             landings_night=landings_night,
-            night_flight_time=night_flight_time,
-            ifr_time=ifr_time
+            night_minutes=night_flight_minutes,
+            ifr_minutes=ifr_minutes,
+            datetime=takeoffs[index]
         )
         
         # Debug only
@@ -197,3 +407,12 @@ def create_flight_from_email(email_body, aircraft_data):
 
 def create_flight_dicts(flights):
     return [flight.to_dict() for flight in flights]
+
+def create_flight_columns(flights):
+    """Voos em colunas (campo -> lista de valores), com os mesmos campos e formatos de to_dict."""
+    columns = {field: [getattr(flight, field) for flight in flights]
+               for field in FLIGHT_FIELDS if field not in ('flight_time', 'night_flight_time', 'ifr_time')}
+    columns['flight_time'] = [flight.flight_time for flight in flights]
+    columns['night_flight_time'] = [flight.night_flight_time for flight in flights]
+    columns['ifr_time'] = [flight.ifr_time for flight in flights]
+    return {field: columns[field] for field in FLIGHT_FIELDS}
@@ -1,29 +1,177 @@
 import os
+import time
+import cProfile
+import argparse
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from database import get_database, db_connect
+from database import get_database, get_client, close_client, COMMAND_LATENCY, get_gmail_history_id, get_gmail_pending_ids, set_gmail_history_id, upsert_flights, get_state_collection, get_export_mark, set_export_mark, get_latest_flight_id, iter_flights, backfill_night_flight_time
 from email_connect import *
-from flights import Flight, create_flight_from_email, create_flight_dicts, load_aircraft_data
-from excel_manager import add_flights_to_excel
+from flights import Flight, create_flight_from_email, create_flight_dicts, load_aircraft_data, get_airport_by_icao, get_airport_table, SOLAR_TIMES
+from excel_manager import OpenLogbook, reorganize_logbook, write_logbook
+from night_time import format_minutes
+from parse_cache import ParseCache
+from metrics import METRICS
+from rollups import refresh_rollups, rebuild_rollups, currency_summary, totals_by_type
+from tenants import TENANT_WORKERS, load_roster, find_tenant
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import logging
-from datetime import datetime
 
 load_dotenv()
 
 # Configurar o logger
 logging.basicConfig(filename='logbook_creator.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def main():
+LOGBOOK_PATH = "logbook.xlsx"
+AIRCRAFT_CSV_PATH = "_internal/ryanair_aircrafts.csv"
+
+# Cache dos voos já lidos de cada email, para não repetir downloads e parsing após uma falha
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH") or "parse_cache.sqlite"
+
+# Segundos entre verificações de emails novos no modo contínuo
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL") or 30)
+
+# Ficheiros com o resumo de métricas de cada execução (JSON e textfile do Prometheus), se configurados
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH")
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH")
+
+def export_new_flights(flights_collection, state_collection, last_exported, logbook=None, logbook_path=LOGBOOK_PATH):
+    """Adicionar ao Excel apenas os voos ainda não exportados e avançar a marca.
+
+    logbook é um OpenLogbook já aberto (modo contínuo); sem ele o ficheiro logbook_path é aberto e fechado aqui.
+    Se o ficheiro ainda não existir, é escrito de uma vez por write_logbook.
+    """
+    flights = iter_flights(flights_collection, after_id=last_exported, include_id=True)
+    first = next(flights, None)
+    if first is None:
+        logging.info("Sem voos novos para exportar")
+        return 0
+
+    # Os voos passam do cursor para o Excel um a um; só se guarda o mais recente para a marca
+    newest = first
+    exported = 0
+
+    def track(flight_stream):
+        nonlocal newest, exported
+        for flight in flight_stream:
+            exported += 1
+            METRICS.count('db_flights_read')
+            if flight['_id'] > newest['_id']:
+                newest = flight
+            yield flight
+
+    with METRICS.stage('export'):
+        if os.path.exists(logbook_path):
+            if logbook is None:
+                logbook = OpenLogbook(logbook_path, AIRCRAFT_CSV_PATH)
+            logbook.add_flights(track(chain([first], flights)))
+        else:
+            # Um logbook novo recebe todos os voos da DB: é escrito em streaming, página a página,
+            # em vez de os carregar todos num workbook em modo normal
+            write_logbook(logbook_path, track(chain([first], flights)), load_aircraft_data())
+
+    set_export_mark(state_collection, logbook_path, newest['_id'], newest['datetime'])
+    logging.info(f"{exported} voos exportados para {logbook_path}")
+    return exported
+
+def current_export_mark(flights_collection, state_collection, logbook_path=LOGBOOK_PATH):
+    """Marca da última exportação. Um logbook novo recebe todos os voos da DB; um logbook
+    sem marca foi gerado pela exportação completa antiga e já contém os voos atuais."""
+    if not os.path.exists(logbook_path):
+        return None
+    last_exported = get_export_mark(state_collection, logbook_path)
+    if last_exported is None:
+        last_exported = get_latest_flight_id(flights_collection)
+    return last_exported
+
+def ingest_emails(service, service_factory, email_ids, flights_collection, aircraft_data, parse_cache=None, max_workers=MAX_WORKERS):
+    """Ler os voos dos emails de logbook dados, guardá-los na DB e mover os emails processados para o lixo.
+
+    Os emails que já estão em parse_cache (ex: de uma execução que falhou antes do fim) não
+    voltam a ser descarregados nem lidos. Devolve o número de voos lidos e os IDs dos emails que
+    não foi possível obter do Gmail, que ficam na caixa de entrada para uma próxima tentativa.
+    """
+    failed_ids = []
+
+    # Obter os assuntos em pedidos batch, uma única vez
+    subjects = get_email_subjects(service, email_ids, failed_ids)
+
+    # Imprimir os assuntos dos emails
+    print_email_subjects(service, email_ids, subjects)
+
+    # Filtrar emails com assunto "logbook"
+    logbook_email_ids = filter_logbook_emails(service, email_ids, subjects)
+
+    flight_dicts = []
+    processed_email_ids = []
+
+    to_download = []
+    for email_id in logbook_email_ids:
+        cached = parse_cache.get(email_id['id']) if parse_cache is not None else None
+        if cached is None:
+            to_download.append(email_id)
+        elif cached:
+            logging.info(f"Voos do email com ID {email_id['id']} lidos da cache")
+            METRICS.count('parse_cache_hits')
+            flight_dicts.extend(cached)
+            processed_email_ids.append(email_id['id'])
+
+    # Os corpos dos emails são descarregados em paralelo, cada thread com o seu próprio serviço
+    for email_id, body in stream_email_bodies(service_factory, to_download, max_workers, failed=failed_ids):
+        logging.info(f"Processando email com ID: {email_id}")
+
+        # Ler os voos do corpo do email e guardá-los na cache, mesmo que não haja nenhum
+        with METRICS.stage('parse'):
+            flights = create_flight_dicts(create_flight_from_email(body, aircraft_data) or [])
+        METRICS.count('emails_parsed')
+        METRICS.count('flights_created', len(flights))
+        if parse_cache is not None:
+            parse_cache.put(email_id, body, flights)
+
+        if not flights:
+            logging.info(f"Não foram encontrados voos no email com ID: {email_id}")
+            continue
+
+        logging.info(f"Voos encontrados no email com ID: {email_id}")
+
+        for flight in flights:
+            logging.debug("Voo: %s", flight)
+
+        flight_dicts.extend(flights)
+        processed_email_ids.append(email_id)
+
+    SOLAR_TIMES.save()
+
+    # Adicionar os voos na database
+    if flight_dicts:
+        upsert_flights(flights_collection, flight_dicts)
+        refresh_rollups(flights_collection, {flight['date'] for flight in flight_dicts})
+
+    # Só depois de os voos estarem na DB é que os emails processados vão para o lixo
+    if processed_email_ids:
+        trash_emails(service, processed_email_ids)
+
+    if failed_ids:
+        logging.warning(f"{len(failed_ids)} emails não foram obtidos do Gmail e ficam para a próxima tentativa")
+        METRICS.count('emails_failed', len(failed_ids))
+    return len(flight_dicts), failed_ids
+
+def main(rebuild=False):
     try:
         logging.info("Iniciando o programa")
         
         # Conectar à DB
-        db_link = os.getenv("DB_LINK")
-        db = db_connect(db_link)
-        flights_collection = get_database(db)
+        with METRICS.stage('db_connect'):
+            db = get_client()
+            flights_collection = get_database(db)
+            state_collection = get_state_collection(db)
+
+        last_exported = current_export_mark(flights_collection, state_collection)
 
         # Autenticar com Gmail
-        creds = connect_to_gmail()
+        with METRICS.stage('gmail_connect'):
+            creds = connect_to_gmail()
         if not creds:
             logging.error("Falha ao autenticar com Gmail")
             return
@@ -31,60 +179,276 @@ def main():
         # Construir o serviço
         service = build('gmail', 'v1', credentials=creds)
 
-        # Buscar emails
-        email_ids = fetch_emails(service, "INBOX")
+        def service_factory():
+            return build('gmail', 'v1', credentials=creds)
 
-        # Imprimir todos os assuntos dos emails
-        print_email_subjects(service, email_ids)
+        # Buscar apenas os emails que a pesquisa do Gmail indica como logbook
+        email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
 
-        # Filtrar emails com assunto "logbook"
-        logbook_email_ids = filter_logbook_emails(service, email_ids)
+        with METRICS.stage('load_tables'):
+            # Carregar os dados das aeronaves
+            aircraft_data = load_aircraft_data()
 
-        all_flights = []
+            # Cache de nascer/pôr do sol guardada entre execuções, se configurada
+            SOLAR_TIMES.path = os.getenv("SUN_CACHE_PATH")
+            SOLAR_TIMES.load()
 
-        # Carregar os dados das aeronaves
-        aircraft_data = load_aircraft_data()
+        parse_cache = ParseCache(PARSE_CACHE_PATH)
+        try:
+            with METRICS.stage('ingest'):
+                ingest_emails(service, service_factory, email_ids, flights_collection, aircraft_data, parse_cache)
+        finally:
+            parse_cache.close()
+
+        # Adicionar ao Excel apenas os voos novos
+        export_new_flights(flights_collection, state_collection, last_exported)
+
+        # Reconstrução completa (ordenar e repaginar) apenas quando pedida explicitamente
+        if rebuild:
+            logging.info("A reorganizar o logbook")
+            with METRICS.stage('rebuild'):
+                reorganize_logbook(LOGBOOK_PATH, AIRCRAFT_CSV_PATH)
 
-        for id in logbook_email_ids:
-            email_id = id['id']
-            body = get_email_body(service, email_id)
-            logging.info(f"Processando email com ID: {email_id}")
+        logging.info("Programa concluído com sucesso")
+        logging.info(f"Latência do MongoDB: {COMMAND_LATENCY.summary()}")
 
-            # Criar objetos Flight a partir do corpo do email
-            flights = create_flight_from_email(body, aircraft_data)
+    except Exception as e:
+        logging.error("Ocorreu um erro durante a execução do programa", exc_info=True)
+        METRICS.count('run_errors')
+    finally:
+        write_metrics()
 
-            if not flights:
-                logging.info(f"Não foram encontrados voos no email com ID: {email_id}")
-                continue
+def write_metrics():
+    """Registar o resumo das métricas no log e guardá-lo nos ficheiros configurados."""
+    logging.info(f"Métricas da execução: {METRICS.summary()}")
+    METRICS.write(METRICS_JSON_PATH, METRICS_PROM_PATH)
 
-            logging.info(f"Voos encontrados no email com ID: {email_id}")
+def sync_new_emails(service, service_factory, flights_collection, state_collection, logbook=None, parse_cache=None):
+    """Processar os emails chegados desde a última sincronização e exportar os voos novos.
 
-            for flight in flights:
-                logging.info(flight.to_dict())
+    Usa o histórico do Gmail a partir do historyId guardado; sem historyId, ou se já tiver
+    expirado, lista a caixa de entrada completa. Os emails que não foi possível obter ficam
+    guardados no estado e são pedidos de novo na sincronização seguinte, porque o historyId
+    avança mesmo assim. O logbook só é aberto se houver voos novos. Devolve o número de voos lidos.
+    """
+    history_id = get_gmail_history_id(state_collection)
+    pending_ids = get_gmail_pending_ids(state_collection)
+    email_ids = None
+    if history_id is not None:
+        try:
+            email_ids, latest_history_id = fetch_new_email_ids(service, history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logging.warning("O historyId guardado expirou, a listar a caixa de entrada completa")
+    if email_ids is None:
+        # O historyId é lido antes da listagem, para não perder emails que cheguem entretanto
+        latest_history_id = get_history_id(service)
+        email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
 
-            all_flights.extend(flights)
+    # Os emails que falharam da última vez não voltam a aparecer no histórico
+    listed = {email_id['id'] for email_id in email_ids}
+    email_ids += [{'id': email_id} for email_id in pending_ids if email_id not in listed]
 
-            # Deletar o email processado
-            delete_specific_email(service, email_id)
+    flights = 0
+    failed_ids = []
+    if email_ids:
+        last_exported = current_export_mark(flights_collection, state_collection)
+        # O CSV das aeronaves só volta a ser lido se tiver mudado
+        flights, failed_ids = ingest_emails(service, service_factory, email_ids, flights_collection,
+                                            load_aircraft_data(), parse_cache)
+        if flights:
+            export_new_flights(flights_collection, state_collection, last_exported, logbook)
 
-        # Adicionar os voos na database
-        flight_dicts = create_flight_dicts(all_flights)
-        if flight_dicts:
-            flights_collection.insert_many(flight_dicts)
+    set_gmail_history_id(state_collection, latest_history_id, failed_ids)
+    return flights
 
-        # Buscar todos os voos da DB
-        all_flights_from_db = list(flights_collection.find())
+def run_daemon(interval=POLL_INTERVAL):
+    """Ficar em execução e processar os emails novos a cada interval segundos.
 
-        # Ordenar voos por data e hora
-        all_flights_from_db.sort(key=lambda x: datetime.strptime(f"{x['date']} {x['departure_time']}", '%Y/%m/%d %H:%M'))
+    O serviço Gmail, o cliente MongoDB, as tabelas de aeroportos, aeronaves e nascer/pôr do sol e
+    o próprio logbook são carregados uma vez e reutilizados em todas as verificações.
+    """
+    logging.info(f"Modo contínuo: a verificar emails novos a cada {interval}s")
+    db = get_client()
+    flights_collection = get_database(db)
+    state_collection = get_state_collection(db)
 
-        # Adicionar voos ao Excel
-        add_flights_to_excel("logbook.xlsx", all_flights_from_db, "_internal/ryanair_aircrafts.csv")
+    creds = connect_to_gmail()
+    if not creds:
+        logging.error("Falha ao autenticar com Gmail")
+        return
 
-        logging.info("Programa concluído com sucesso")
+    service = build('gmail', 'v1', credentials=creds)
+
+    def service_factory():
+        return build('gmail', 'v1', credentials=creds)
 
+    SOLAR_TIMES.path = os.getenv("SUN_CACHE_PATH")
+    SOLAR_TIMES.load()
+    get_airport_table()
+    logbook = OpenLogbook(LOGBOOK_PATH, AIRCRAFT_CSV_PATH)
+    parse_cache = ParseCache(PARSE_CACHE_PATH)
+
+    while True:
+        try:
+            with METRICS.stage('poll'):
+                flights = sync_new_emails(service, service_factory, flights_collection, state_collection, logbook, parse_cache)
+            if flights:
+                logging.info(f"{flights} voos novos processados")
+        except Exception:
+            # Uma falha numa verificação não termina o processo; tenta-se de novo no próximo intervalo
+            logging.error("Ocorreu um erro ao processar os emails novos", exc_info=True)
+            METRICS.count('run_errors')
+        # Métricas acumuladas desde o arranque, atualizadas a cada verificação
+        METRICS.write(METRICS_JSON_PATH, METRICS_PROM_PATH)
+        time.sleep(interval)
+
+def recompute_night_times():
+    """Recalcular o tempo noturno de todos os voos já guardados na DB."""
+    try:
+        logging.info("A recalcular o tempo noturno de todos os voos")
+        db = get_client()
+        flights_collection = get_database(db)
+        backfill_night_flight_time(flights_collection, get_airport_by_icao, SOLAR_TIMES)
+        rebuild_rollups(flights_collection)
     except Exception as e:
-        logging.error("Ocorreu um erro durante a execução do programa", exc_info=True)
+        logging.error("Ocorreu um erro ao recalcular o tempo noturno", exc_info=True)
+
+def process_tenant(tenant, client, aircraft_data, rebuild=False):
+    """Processar a caixa de correio de um piloto do roster: os voos vão para as suas coleções e o seu logbook.
+
+    Corre numa thread do pool de run_roster. Devolve (voos lidos, voos exportados).
+    """
+    logging.info(f"Piloto {tenant.name}: a processar")
+
+    # Sem token válido não se abre o browser: os outros pilotos continuam
+    creds = connect_to_gmail(tenant.token_path, interactive=False)
+    if not creds:
+        raise RuntimeError(f"sem token do Gmail válido (use --authorize {tenant.name})")
+
+    flights_collection = get_database(client, tenant.name)
+    state_collection = get_state_collection(client, tenant.name)
+    last_exported = current_export_mark(flights_collection, state_collection, tenant.logbook_path)
+
+    service = build('gmail', 'v1', credentials=creds)
+
+    def service_factory():
+        return build('gmail', 'v1', credentials=creds)
+
+    email_ids = fetch_emails(service, "INBOX", LOGBOOK_QUERY)
+
+    parse_cache = ParseCache(tenant.parse_cache_path)
+    try:
+        # Os emails que falharem ficam na caixa de entrada e voltam a ser listados na execução seguinte
+        flights, _ = ingest_emails(service, service_factory, email_ids, flights_collection, aircraft_data,
+                                   parse_cache, tenant.workers)
+    finally:
+        parse_cache.close()
+
+    exported = export_new_flights(flights_collection, state_collection, last_exported, logbook_path=tenant.logbook_path)
+    if rebuild:
+        reorganize_logbook(tenant.logbook_path, AIRCRAFT_CSV_PATH)
+    return flights, exported
+
+def run_roster(roster_path, workers=TENANT_WORKERS, rebuild=False):
+    """Processar todos os pilotos do roster, até workers ao mesmo tempo.
+
+    Cada piloto corre isolado: uma caixa de correio lenta só ocupa uma thread do pool e uma falha
+    é registada sem interromper os outros. Devolve os nomes dos pilotos que falharam.
+    """
+    tenants = load_roster(roster_path)
+    logging.info(f"Modo multi-piloto: {len(tenants)} pilotos, {workers} em paralelo")
+    failed = []
+    try:
+        client = get_client()
+
+        # Tabelas partilhadas por todos os pilotos, carregadas uma vez
+        aircraft_data = load_aircraft_data()
+        SOLAR_TIMES.path = os.getenv("SUN_CACHE_PATH")
+        SOLAR_TIMES.load()
+        get_airport_table()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tenant') as executor:
+            futures = {executor.submit(process_tenant, tenant, client, aircraft_data, rebuild): tenant for tenant in tenants}
+            for future in as_completed(futures):
+                tenant = futures[future]
+                try:
+                    flights, exported = future.result()
+                except Exception as e:
+                    logging.error(f"Piloto {tenant.name}: falha no processamento: {e}", exc_info=True)
+                    METRICS.count('tenants_failed')
+                    failed.append(tenant.name)
+                    continue
+                logging.info(f"Piloto {tenant.name}: {flights} voos lidos, {exported} exportados")
+                METRICS.count('tenants_processed')
+    finally:
+        write_metrics()
+
+    if failed:
+        print(f"Pilotos com falhas: {', '.join(sorted(failed))}")
+    return failed
+
+def authorize_tenant(roster_path, name):
+    """Autorizar o acesso à caixa de correio de um piloto do roster (abre o browser) e guardar o token."""
+    tenant = find_tenant(load_roster(roster_path), name)
+    if connect_to_gmail(tenant.token_path):
+        print(f"Token de {tenant.name} guardado em {tenant.token_path}")
+
+def print_totals(rebuild=False):
+    """Mostrar os totais para recência e limites de tempo de voo e os totais por tipo de aeronave."""
+    flights_collection = get_database(get_client())
+    if rebuild:
+        rebuild_rollups(flights_collection)
+
+    def describe(totals):
+        return (f"{totals.flights} voos, {format_minutes(totals.block_minutes)} de bloco, "
+                f"{format_minutes(totals.night_minutes)} noturno, {totals.takeoffs_day + totals.takeoffs_night} descolagens, "
+                f"{totals.landings_day + totals.landings_night} aterragens ({totals.landings_night} noturnas)")
+
+    for name, totals in currency_summary(flights_collection).items():
+        print(f"{name}: {describe(totals)}")
+    for aircraft_type, totals in sorted(totals_by_type(flights_collection).items()):
+        print(f"{aircraft_type}: {describe(totals)}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Gerar o logbook a partir dos emails de voo")
+    parser.add_argument("--rebuild", action="store_true", help="reordenar e repaginar todo o logbook no fim da execução")
+    parser.add_argument("--daemon", action="store_true", help="ficar em execução e processar os emails novos à medida que chegam")
+    parser.add_argument("--interval", type=int, default=POLL_INTERVAL, help="segundos entre verificações no modo contínuo")
+    parser.add_argument("--totals", action="store_true", help="mostrar os totais de 28 dias, 90 dias, 12 meses e por tipo de aeronave e sair")
+    parser.add_argument("--rebuild-totals", action="store_true", help="recalcular todos os totais a partir dos voos antes de os mostrar")
+    parser.add_argument("--recompute-night", action="store_true", help="recalcular o tempo noturno de todos os voos da DB e sair")
+    parser.add_argument("--metrics-json", default=METRICS_JSON_PATH, help="ficheiro JSON com o resumo de métricas da execução")
+    parser.add_argument("--metrics-prom", default=METRICS_PROM_PATH, help="ficheiro .prom com as métricas, para o textfile collector do Prometheus")
+    parser.add_argument("--profile", metavar="FICHEIRO", help="guardar um perfil cProfile da execução no ficheiro dado")
+    parser.add_argument("--roster", metavar="FICHEIRO", help="processar todos os pilotos do roster JSON (ver tenants.py)")
+    parser.add_argument("--tenant-workers", type=int, default=TENANT_WORKERS, help="pilotos do roster processados em paralelo")
+    parser.add_argument("--authorize", metavar="PILOTO", help="autorizar o Gmail de um piloto do roster e sair")
+    args = parser.parse_args()
+    if args.authorize and not args.roster:
+        parser.error("--authorize precisa de --roster")
+    METRICS_JSON_PATH, METRICS_PROM_PATH = args.metrics_json, args.metrics_prom
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        if args.authorize:
+            authorize_tenant(args.roster, args.authorize)
+        elif args.roster:
+            run_roster(args.roster, args.tenant_workers, rebuild=args.rebuild)
+        elif args.recompute_night:
+            recompute_night_times()
+        elif args.totals or args.rebuild_totals:
+            print_totals(rebuild=args.rebuild_totals)
+        elif args.daemon:
+            run_daemon(args.interval)
+        else:
+            main(rebuild=args.rebuild)
+    finally:
+        close_client()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
@@ -0,0 +1,102 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from atomic_file import replace_atomically
+
+PROMETHEUS_PREFIX = "logbook"
+
+class RunMetrics:
+    """Tempos por etapa e contadores de uma execução, partilhados por todas as threads.
+
+    O tempo de uma etapa que corre em várias threads ao mesmo tempo (ex: downloads de emails)
+    é a soma dos tempos de cada thread, por isso pode ser maior do que a duração da execução.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.start = time.perf_counter()
+            self.stages = {}
+            self.counters = {}
+
+    def record(self, stage, seconds):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Medir o tempo do bloco como uma chamada da etapa name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorador que mede cada chamada da função como uma chamada da etapa name."""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Resumo da execução: início, duração, etapas e contadores."""
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': time.perf_counter() - self.start,
+                'stages': {name: dict(stats) for name, stats in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        """Resumo no formato de texto do Prometheus (para o textfile collector do node_exporter)."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_run_timestamp_seconds Início da última execução.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_timestamp_seconds {summary['started_at']:.3f}",
+            f"# HELP {PROMETHEUS_PREFIX}_run_duration_seconds Duração da última execução.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_duration_seconds {summary['duration_seconds']:.6f}",
+        ]
+        for metric, field, help_text in (('stage_seconds_total', 'seconds', "Tempo gasto em cada etapa."),
+                                         ('stage_calls_total', 'calls', "Número de chamadas de cada etapa."),
+                                         ('stage_max_seconds', 'max_seconds', "Chamada mais lenta de cada etapa.")):
+            metric_type = 'gauge' if metric == 'stage_max_seconds' else 'counter'
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} {metric_type}")
+            for stage, stats in sorted(summary['stages'].items()):
+                lines.append(f'{PROMETHEUS_PREFIX}_{metric}{{stage="{stage}"}} {stats[field]}')
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prometheus_path=None):
+        """Guardar o resumo em JSON e/ou no formato do Prometheus, substituindo os ficheiros de forma atómica."""
+        if json_path:
+            with replace_atomically(json_path, 'w') as file:
+                json.dump(self.summary(), file, indent=2)
+        if prometheus_path:
+            with replace_atomically(prometheus_path, 'w') as file:
+                file.write(self.to_prometheus())
+
+# Métricas da execução atual, usadas por todos os módulos
+METRICS = RunMetrics()
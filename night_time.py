@@ -0,0 +1,94 @@
+# Noite EASA: do fim do crepúsculo civil da tarde ao início do da manhã, com o sol 6° abaixo do
+# horizonte. As descolagens e aterragens continuam a ser classificadas pelo nascer/pôr do sol.
+NIGHT_ELEVATION = -6.0
+
+# Número de voos processados de cada vez, para limitar a memória das matrizes (voos x minutos)
+CHUNK_SIZE = 2000
+
+def great_circle_points(departure, arrival, fractions):
+    """Latitude e longitude (graus) dos pontos nas frações dadas da rota ortodrómica.
+
+    departure e arrival têm forma (n, 2) com (latitude, longitude); fractions tem forma (n, m).
+    """
+    import numpy as np
+    lat1, lon1 = np.radians(departure[:, 0])[:, None], np.radians(departure[:, 1])[:, None]
+    lat2, lon2 = np.radians(arrival[:, 0])[:, None], np.radians(arrival[:, 1])[:, None]
+
+    start = np.stack([np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)])
+    end = np.stack([np.cos(lat2) * np.cos(lon2), np.cos(lat2) * np.sin(lon2), np.sin(lat2)])
+    angle = np.arccos(np.clip((start * end).sum(axis=0), -1, 1))
+
+    # Interpolação esférica; quando os dois pontos coincidem fica no ponto de partida
+    sin_angle = np.sin(angle)
+    safe = sin_angle > 1e-12
+    weight_start = np.where(safe, np.sin((1 - fractions) * angle) / np.where(safe, sin_angle, 1), 1 - fractions)
+    weight_end = np.where(safe, np.sin(fractions * angle) / np.where(safe, sin_angle, 1), fractions)
+    x, y, z = start * weight_start + end * weight_end
+
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+def solar_elevation(latitudes, longitudes, days_of_year, utc_hours):
+    """Elevação do sol (graus) pelas equações aproximadas da NOAA, para arrays com a mesma forma."""
+    import numpy as np
+    gamma = 2 * np.pi / 365 * (days_of_year - 1 + (utc_hours - 12) / 24)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                 - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    declination = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+                   - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    true_solar_minutes = utc_hours * 60 + equation_of_time + 4 * longitudes
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    latitudes = np.radians(latitudes)
+    cos_zenith = np.sin(latitudes) * np.sin(declination) + np.cos(latitudes) * np.cos(declination) * np.cos(hour_angle)
+    return 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+
+def compute_night_minutes(departures, arrivals, takeoffs, durations):
+    """Minutos de voo noturno de cada voo, seguindo a rota ortodrómica minuto a minuto.
+
+    departures e arrivals são listas de (latitude, longitude), takeoffs são datetimes UTC e
+    durations são minutos de voo. Devolve um array de inteiros.
+    O NumPy só é importado aqui, para que importar o parser não pague o seu arranque.
+    """
+    import numpy as np
+    departures = np.asarray(departures, dtype=float).reshape(-1, 2)
+    arrivals = np.asarray(arrivals, dtype=float).reshape(-1, 2)
+    durations = np.asarray(durations, dtype=int)
+    takeoff_days = np.array([takeoff.timetuple().tm_yday for takeoff in takeoffs], dtype=float)
+    takeoff_hours = np.array([takeoff.hour + takeoff.minute / 60 for takeoff in takeoffs], dtype=float)
+
+    night_minutes = np.zeros(len(durations), dtype=int)
+    for start in range(0, len(durations), CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        chunk_durations = durations[chunk]
+        if not len(chunk_durations) or chunk_durations.max() <= 0:
+            continue
+
+        # Um ponto a meio de cada minuto de voo; os minutos para lá da aterragem ficam mascarados
+        minutes = np.arange(chunk_durations.max()) + 0.5
+        in_flight = minutes[None, :] < chunk_durations[:, None]
+        fractions = np.clip(minutes[None, :] / np.maximum(chunk_durations, 1)[:, None], 0, 1)
+
+        latitudes, longitudes = great_circle_points(departures[chunk], arrivals[chunk], fractions)
+        utc_hours = takeoff_hours[chunk][:, None] + minutes[None, :] / 60
+        days = takeoff_days[chunk][:, None] + np.floor(utc_hours / 24)
+        elevation = solar_elevation(latitudes, longitudes, days, utc_hours % 24)
+
+        night_minutes[chunk] = ((elevation < NIGHT_ELEVATION) & in_flight).sum(axis=1)
+    return night_minutes
+
+def flight_duration_minutes(departure_time, arrival_time):
+    """Minutos entre a descolagem e a aterragem ('HH:MM'), contando com voos que passam a meia-noite."""
+    departure_hours, departure_minutes = departure_time.split(':')
+    arrival_hours, arrival_minutes = arrival_time.split(':')
+    minutes = (int(arrival_hours) - int(departure_hours)) * 60 + int(arrival_minutes) - int(departure_minutes)
+    return minutes % (24 * 60)
+
+def parse_minutes(value):
+    """Converter 'HH:MM' em minutos."""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def format_minutes(minutes):
+    """Converter minutos em 'HH:MM'."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
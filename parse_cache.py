@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import hashlib
+from datetime import datetime
+from urllib.request import pathname2url
+
+# Aumentar quando o parser mudar de forma a alterar os voos lidos; as entradas antigas passam a ser ignoradas
+CACHE_VERSION = 2
+
+MAX_ENTRIES = 20000
+MAX_AGE_DAYS = 90
+
+def body_hash(body):
+    """Hash SHA-256 do corpo do email."""
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+def _encode_flights(flight_dicts):
+    return json.dumps(flight_dicts, default=lambda value: value.isoformat())
+
+def _decode_flights(data):
+    flight_dicts = json.loads(data)
+    for flight_dict in flight_dicts:
+        flight_dict['datetime'] = datetime.fromisoformat(flight_dict['datetime'])
+    return flight_dicts
+
+class ParseCache:
+    """Cache em SQLite dos voos lidos de cada email, por ID da mensagem e hash do corpo.
+
+    Permite que uma execução repetida (ou uma importação de um arquivo) não volte a descarregar
+    nem a ler emails já processados. Também guarda os emails sem voos (lista vazia).
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS, read_only=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        if read_only:
+            # Só consultas (ex: nos processos do backfill), enquanto outra ligação escreve na cache
+            self.connection = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+            return
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS parsed_emails ("
+            "message_id TEXT PRIMARY KEY, body_hash TEXT NOT NULL, version INTEGER NOT NULL, "
+            "flights TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS parsed_emails_body_hash ON parsed_emails (body_hash)")
+        self.connection.commit()
+        self.evict()
+
+    def get(self, message_id):
+        """Voos guardados para o ID de mensagem dado, ou None se o email ainda não foi lido."""
+        row = self.connection.execute(
+            "SELECT flights FROM parsed_emails WHERE message_id = ? AND version = ?", (message_id, CACHE_VERSION)
+        ).fetchone()
+        return _decode_flights(row[0]) if row else None
+
+    def get_by_body(self, body):
+        """Voos guardados para um email com o mesmo corpo, ou None."""
+        row = self.connection.execute(
+            "SELECT flights FROM parsed_emails WHERE body_hash = ? AND version = ? LIMIT 1", (body_hash(body), CACHE_VERSION)
+        ).fetchone()
+        return _decode_flights(row[0]) if row else None
+
+    def put(self, message_id, body, flight_dicts):
+        """Guardar os voos lidos do email."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO parsed_emails (message_id, body_hash, version, flights, created_at) VALUES (?, ?, ?, ?, ?)",
+            (message_id, body_hash(body), CACHE_VERSION, _encode_flights(flight_dicts), time.time())
+        )
+        self.connection.commit()
+
+    def evict(self):
+        """Apagar as entradas de outra versão, as mais antigas que max_age_days e as que excedem max_entries."""
+        cutoff = time.time() - self.max_age_days * 24 * 3600
+        deleted = self.connection.execute(
+            "DELETE FROM parsed_emails WHERE version != ? OR created_at < ?", (CACHE_VERSION, cutoff)
+        ).rowcount
+        deleted += self.connection.execute(
+            "DELETE FROM parsed_emails WHERE message_id IN "
+            "(SELECT message_id FROM parsed_emails ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        ).rowcount
+        self.connection.commit()
+        if deleted:
+            logging.info(f"Cache de emails lidos: {deleted} entradas removidas")
+        return deleted
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM parsed_emails").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
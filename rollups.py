@@ -0,0 +1,232 @@
+import logging
+from datetime import datetime, date, time as datetime_time, timedelta
+from pymongo import ReplaceOne
+from night_time import parse_minutes
+from metrics import METRICS
+
+# Totais mantidos por dia, por mês e por página do logbook
+TOTAL_FIELDS = ('flights', 'block_minutes', 'night_minutes', 'takeoffs_day', 'takeoffs_night', 'landings_day', 'landings_night')
+
+def duration_minutes(value):
+    """Minutos de uma duração lida da DB ou do Excel ('HH:MM', time ou vazio)."""
+    if not value:
+        return 0
+    if isinstance(value, datetime_time):
+        return value.hour * 60 + value.minute
+    return parse_minutes(str(value))
+
+class FlightTotals:
+    """Soma do número de voos, tempo de bloco e noturno (minutos), descolagens e aterragens."""
+    __slots__ = TOTAL_FIELDS
+
+    def __init__(self, **values):
+        for field in TOTAL_FIELDS:
+            setattr(self, field, values.get(field, 0))
+
+    def add(self, flight_dict):
+        """Somar um voo no formato da DB (ver Flight.to_dict)."""
+        self.flights += 1
+        self.block_minutes += duration_minutes(flight_dict.get('flight_time'))
+        self.night_minutes += duration_minutes(flight_dict.get('night_flight_time'))
+        self.takeoffs_day += flight_dict.get('takeoffs_day') or 0
+        self.takeoffs_night += flight_dict.get('takeoffs_night') or 0
+        self.landings_day += flight_dict.get('landings_day') or 0
+        self.landings_night += flight_dict.get('landings_night') or 0
+        return self
+
+    def merge(self, other):
+        """Somar outros totais a estes."""
+        for field in TOTAL_FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def __add__(self, other):
+        return FlightTotals(**self.to_dict()).merge(other)
+
+    def __eq__(self, other):
+        return isinstance(other, FlightTotals) and self.to_dict() == other.to_dict()
+
+    def __bool__(self):
+        return any(getattr(self, field) for field in TOTAL_FIELDS)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TOTAL_FIELDS}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{field: values.get(field, 0) for field in TOTAL_FIELDS})
+
+    def __repr__(self):
+        return f"FlightTotals({self.to_dict()})"
+
+def _tenant_suffix(flights_collection):
+    # A coleção de voos de um piloto (flights.<piloto>) tem os seus próprios totais (daily_totals.<piloto>)
+    _, dot, tenant = flights_collection.name.partition('.')
+    return dot + tenant
+
+def get_daily_collection(flights_collection):
+    return flights_collection.database["daily_totals" + _tenant_suffix(flights_collection)]
+
+def get_monthly_collection(flights_collection):
+    return flights_collection.database["monthly_totals" + _tenant_suffix(flights_collection)]
+
+def type_key(aircraft_type):
+    # Os nomes dos campos no MongoDB não podem ter '.' nem começar por '$'
+    return str(aircraft_type or 'NA').replace('.', '_').replace('$', '_')
+
+def _minutes_expression(field):
+    parts = {'$split': [{'$ifNull': [field, '00:00']}, ':']}
+    return {'$add': [{'$multiply': [{'$toInt': {'$arrayElemAt': [parts, 0]}}, 60]},
+                     {'$toInt': {'$arrayElemAt': [parts, 1]}}]}
+
+def _daily_pipeline(dates=None):
+    """Pipeline de agregação com os totais de cada (dia, tipo de aeronave), calculados no servidor."""
+    pipeline = [{'$match': {'date': {'$in': sorted(dates)}}}] if dates is not None else []
+    pipeline.append({'$group': {
+        '_id': {'date': '$date', 'aircraft_type': '$aircraft_type'},
+        'flights': {'$sum': 1},
+        'block_minutes': {'$sum': _minutes_expression('$flight_time')},
+        'night_minutes': {'$sum': _minutes_expression('$night_flight_time')},
+        'takeoffs_day': {'$sum': '$takeoffs_day'},
+        'takeoffs_night': {'$sum': '$takeoffs_night'},
+        'landings_day': {'$sum': '$landings_day'},
+        'landings_night': {'$sum': '$landings_night'},
+    }})
+    return pipeline
+
+def _summary_document(summary_id, totals, by_type, **fields):
+    document = {'_id': summary_id, **fields, **totals.to_dict()}
+    document['by_type'] = {aircraft_type: type_totals.to_dict() for aircraft_type, type_totals in by_type.items()}
+    return document
+
+def _write_daily_totals(flights_collection, pipeline, dates=None):
+    days = {}
+    for group in flights_collection.aggregate(pipeline):
+        flight_date = group['_id']['date']
+        totals, by_type = days.setdefault(flight_date, (FlightTotals(), {}))
+        group_totals = FlightTotals.from_dict(group)
+        totals.merge(group_totals)
+        by_type.setdefault(type_key(group['_id']['aircraft_type']), FlightTotals()).merge(group_totals)
+
+    daily = get_daily_collection(flights_collection)
+    operations = []
+    for flight_date, (totals, by_type) in days.items():
+        day = datetime.strptime(flight_date, '%Y/%m/%d')
+        operations.append(ReplaceOne({'_id': flight_date}, _summary_document(
+            flight_date, totals, by_type, day=day, month=day.strftime('%Y/%m')), upsert=True))
+    if operations:
+        daily.bulk_write(operations, ordered=False)
+
+    # Dias que deixaram de ter voos
+    if dates is not None:
+        empty = sorted(set(dates) - set(days))
+        if empty:
+            daily.delete_many({'_id': {'$in': empty}})
+    return days
+
+def _write_monthly_totals(flights_collection, months):
+    daily = get_daily_collection(flights_collection)
+    monthly = get_monthly_collection(flights_collection)
+    for month in months:
+        totals, by_type = FlightTotals(), {}
+        for document in daily.find({'month': month}):
+            totals.merge(FlightTotals.from_dict(document))
+            for aircraft_type, values in document.get('by_type', {}).items():
+                by_type.setdefault(aircraft_type, FlightTotals()).merge(FlightTotals.from_dict(values))
+        if totals.flights:
+            monthly.replace_one({'_id': month}, _summary_document(month, totals, by_type), upsert=True)
+        else:
+            monthly.delete_one({'_id': month})
+
+def ensure_rollup_indexes(flights_collection):
+    get_daily_collection(flights_collection).create_index('day')
+    get_daily_collection(flights_collection).create_index('month')
+
+@METRICS.timed('db_rollups')
+def refresh_rollups(flights_collection, dates):
+    """Recalcular os totais dos dias dados ('YYYY/MM/DD') e dos meses a que pertencem.
+
+    Chamado depois de cada escrita de voos com as datas escritas: cada dia é recalculado a partir
+    dos seus voos (o índice único começa pela data), por isso voos repetidos ou atualizados
+    nunca são contados duas vezes.
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    _write_daily_totals(flights_collection, _daily_pipeline(dates), dates)
+    _write_monthly_totals(flights_collection, {flight_date[:7] for flight_date in dates})
+
+@METRICS.timed('db_rollups_rebuild')
+def rebuild_rollups(flights_collection):
+    """Recalcular todos os totais diários e mensais com uma agregação sobre toda a coleção de voos."""
+    get_daily_collection(flights_collection).delete_many({})
+    get_monthly_collection(flights_collection).delete_many({})
+    days = _write_daily_totals(flights_collection, _daily_pipeline())
+    _write_monthly_totals(flights_collection, {flight_date[:7] for flight_date in days})
+    logging.info(f"Totais recalculados: {len(days)} dias com voos")
+    return len(days)
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _add_summaries(documents, totals, by_type):
+    for document in documents:
+        totals.merge(FlightTotals.from_dict(document))
+        for aircraft_type, values in document.get('by_type', {}).items():
+            by_type.setdefault(aircraft_type, FlightTotals()).merge(FlightTotals.from_dict(values))
+
+def window_totals(flights_collection, start, end):
+    """Totais dos voos entre as datas start e end (inclusive), e os mesmos totais por tipo de aeronave.
+
+    Os meses completos no intervalo são lidos dos totais mensais e só os dias das pontas dos
+    totais diários, por isso um intervalo de um ano lê no máximo 12 meses e 60 dias.
+    """
+    start, end = _as_date(start), _as_date(end)
+    totals, by_type = FlightTotals(), {}
+    if start > end:
+        return totals, by_type
+
+    # Primeiro e último mês completos dentro do intervalo
+    first_month = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    next_month = (end.replace(day=28) + timedelta(days=4)).replace(day=1)
+    last_month = next_month if end == next_month - timedelta(days=1) else end.replace(day=1)
+
+    daily = get_daily_collection(flights_collection)
+    if first_month < last_month:
+        months = {'$gte': first_month.strftime('%Y/%m'), '$lt': last_month.strftime('%Y/%m')}
+        _add_summaries(get_monthly_collection(flights_collection).find({'_id': months}), totals, by_type)
+        day_ranges = [(start, first_month), (last_month, end + timedelta(days=1))]
+    else:
+        day_ranges = [(start, end + timedelta(days=1))]
+
+    for range_start, range_end in day_ranges:
+        if range_start < range_end:
+            days = {'$gte': datetime.combine(range_start, datetime_time.min), '$lt': datetime.combine(range_end, datetime_time.min)}
+            _add_summaries(daily.find({'day': days}), totals, by_type)
+    return totals, by_type
+
+def rolling_totals(flights_collection, days, end=None):
+    """Totais dos últimos days dias, terminando em end (por omissão, hoje em UTC)."""
+    end = _as_date(end) or datetime.utcnow().date()
+    return window_totals(flights_collection, end - timedelta(days=days - 1), end)
+
+def currency_summary(flights_collection, today=None):
+    """Totais para recência e limites de tempo de voo: 28 dias, 90 dias, 12 meses e ano civil.
+
+    Os 12 meses são 12 meses de calendário consecutivos, como no limite FTL: do primeiro dia do
+    mês de há 11 meses até hoje.
+    """
+    today = _as_date(today) or datetime.utcnow().date()
+    summary = {}
+    for name, days in (('last_28_days', 28), ('last_90_days', 90)):
+        summary[name] = rolling_totals(flights_collection, days, today)[0]
+    first_month = today.year * 12 + today.month - 1 - 11
+    summary['last_12_months'] = window_totals(flights_collection, date(first_month // 12, first_month % 12 + 1, 1), today)[0]
+    summary['calendar_year'] = window_totals(flights_collection, date(today.year, 1, 1), today)[0]
+    return summary
+
+def totals_by_type(flights_collection):
+    """Totais de sempre por tipo de aeronave, a partir dos totais mensais."""
+    totals, by_type = FlightTotals(), {}
+    _add_summaries(get_monthly_collection(flights_collection).find({}), totals, by_type)
+    return by_type
@@ -0,0 +1,174 @@
+import os
+import json
+import math
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from atomic_file import replace_atomically
+from suntime import Sun, MidnightSunException, PolarNightException
+
+# Mesmas constantes do suntime, para que os resultados coincidam com Sun.get_sunrise_time/get_sunset_time
+ZENITH = 90.8
+TO_RAD = math.pi / 180.0
+
+# Abaixo deste número de pontos o custo fixo do NumPy é maior do que usar o suntime ponto a ponto.
+# O NumPy só é importado nos cálculos vetorizados, para não pesar no arranque de quem importa o parser.
+VECTORIZE_THRESHOLD = 32
+
+def _force_range(values, maximum):
+    # Tal como no suntime: um único ajuste para o intervalo [0, maximum)
+    import numpy as np
+    return np.where(values < 0, values + maximum, np.where(values >= maximum, values - maximum, values))
+
+def sun_hours_utc(latitudes, longitudes, days_of_year, is_rise_time):
+    """Calcular a hora UTC (em horas decimais) do nascer ou pôr do sol para vários pontos de uma vez.
+
+    Usa o algoritmo do suntime vetorizado com NumPy; is_rise_time pode ser um booleano ou um array.
+    Devolve (horas, estado): o estado é 1 quando o sol nunca se põe, -1 quando nunca nasce e 0 nos
+    restantes casos, em que as horas são válidas.
+    """
+    import numpy as np
+    latitudes = np.asarray(latitudes, dtype=float)
+    lng_hour = np.asarray(longitudes, dtype=float) / 15
+    days_of_year = np.asarray(days_of_year, dtype=float)
+    is_rise_time = np.asarray(is_rise_time, dtype=bool)
+
+    t = days_of_year + ((np.where(is_rise_time, 6, 18) - lng_hour) / 24)
+    mean_anomaly = (0.9856 * t) - 3.289
+    true_longitude = mean_anomaly + (1.916 * np.sin(TO_RAD * mean_anomaly)) + (0.020 * np.sin(TO_RAD * 2 * mean_anomaly)) + 282.634
+    true_longitude = _force_range(true_longitude, 360)
+
+    sin_dec = 0.39782 * np.sin(TO_RAD * true_longitude)
+    cos_dec = np.cos(np.arcsin(sin_dec))
+    cos_h = (np.cos(TO_RAD * ZENITH) - (sin_dec * np.sin(TO_RAD * latitudes))) / (cos_dec * np.cos(TO_RAD * latitudes))
+
+    hour_angle = np.arccos(np.clip(cos_h, -1, 1)) / TO_RAD
+    hour_angle = np.where(is_rise_time, 360 - hour_angle, hour_angle) / 15
+
+    right_ascension = _force_range(np.arctan(0.91764 * np.tan(TO_RAD * true_longitude)) / TO_RAD, 360)
+    right_ascension = right_ascension + (np.floor(true_longitude / 90) * 90 - np.floor(right_ascension / 90) * 90)
+    right_ascension = right_ascension / 15
+
+    local_mean_time = hour_angle + right_ascension - (0.06571 * t) - 6.622
+    ut = _force_range(np.round(local_mean_time - lng_hour, 2), 24)
+    state = np.where(cos_h < -1, 1, np.where(cos_h > 1, -1, 0))
+    return ut, state
+
+def hours_to_time(hours):
+    """Converter horas decimais em datetime.time."""
+    return (datetime.min + timedelta(hours=hours)).time()
+
+def sun_times_at(latitude, longitude, date):
+    """Nascer e pôr do sol (UTC) de um único ponto, com o suntime.
+
+    No sol da meia-noite devolve (time.min, time.max) e na noite polar (time.max, time.min),
+    para que is_night_time continue a dar o resultado certo.
+    """
+    sun = Sun(latitude, longitude)
+    try:
+        return sun.get_sunrise_time(date).time(), sun.get_sunset_time(date).time()
+    except MidnightSunException:
+        return time.min, time.max
+    except PolarNightException:
+        return time.max, time.min
+
+def compute_sun_times(latitudes, longitudes, dates):
+    """Nascer e pôr do sol (UTC) para listas de coordenadas e datas, numa única chamada vetorizada."""
+    count = len(dates)
+    if count < VECTORIZE_THRESHOLD:
+        return [sun_times_at(latitude, longitude, date) for latitude, longitude, date in zip(latitudes, longitudes, dates)]
+
+    days_of_year = [date.timetuple().tm_yday for date in dates]
+    # Nascer e pôr do sol calculados na mesma chamada
+    hours, states = sun_hours_utc(
+        list(latitudes) * 2,
+        list(longitudes) * 2,
+        days_of_year * 2,
+        [True] * count + [False] * count,
+    )
+    hours, states = hours.tolist(), states.tolist()
+
+    results = []
+    for sunrise, sunset, rise_state, set_state in zip(hours[:count], hours[count:], states[:count], states[count:]):
+        # Tal como sun_times_at: o nascer é calculado primeiro, por isso o seu estado prevalece
+        state = rise_state or set_state
+        if state == 1:
+            results.append((time.min, time.max))
+        elif state == -1:
+            results.append((time.max, time.min))
+        else:
+            results.append((hours_to_time(sunrise), hours_to_time(sunset)))
+    return results
+
+class SolarTimesCache:
+    """Cache LRU de (nascer, pôr do sol) por (aeroporto IATA, data), opcionalmente guardada em disco.
+
+    Partilhada pelas threads que processam vários pilotos ao mesmo tempo, por isso protegida por um lock.
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, iata_code, date, position):
+        """Devolver (nascer, pôr do sol) para o aeroporto e data dados."""
+        return self.get_many([(iata_code, date, position)])[0]
+
+    def get_many(self, requests):
+        """Devolver (nascer, pôr do sol) para uma lista de (iata, data, (latitude, longitude)).
+
+        Todas as entradas que não estão na cache são calculadas numa única chamada vetorizada.
+        """
+        keys = [(iata_code, date.strftime('%Y-%m-%d')) for iata_code, date, _ in requests]
+        with self.lock:
+            return self._get_many(keys, requests)
+
+    def _get_many(self, keys, requests):
+        missing = {}
+        for key, request in zip(keys, requests):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            elif key not in missing:
+                missing[key] = request
+
+        if missing:
+            latitudes = [latitude for _, _, (latitude, _) in missing.values()]
+            longitudes = [longitude for _, _, (_, longitude) in missing.values()]
+            dates = [date for _, date, _ in missing.values()]
+            for key, times in zip(missing, compute_sun_times(latitudes, longitudes, dates)):
+                self.entries[key] = times
+
+        results = [self.entries[key] for key in keys]
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return results
+
+    def load(self):
+        """Carregar a cache guardada em disco, se existir."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Não foi possível ler a cache de nascer/pôr do sol {self.path}: {e}")
+            return
+        with self.lock:
+            for key, (sunrise, sunset) in stored.items():
+                iata_code, date = key.split('|')
+                self.entries[(iata_code, date)] = (time.fromisoformat(sunrise), time.fromisoformat(sunset))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Guardar a cache em disco, substituindo o ficheiro de forma atómica."""
+        if not self.path:
+            return
+        with self.lock:
+            stored = {f"{iata_code}|{date}": [sunrise.isoformat(), sunset.isoformat()]
+                      for (iata_code, date), (sunrise, sunset) in self.entries.items()}
+            with replace_atomically(self.path, 'w') as file:
+                json.dump(stored, file)
@@ -0,0 +1,69 @@
+"""Roster do modo multi-piloto: cada piloto tem a sua caixa de correio (token do Gmail), as suas
+coleções na DB (flights.<piloto>, state.<piloto>, ...), a sua cache de emails lidos e o seu logbook.
+
+O roster é um ficheiro JSON com uma lista de pilotos, por exemplo:
+
+    [
+        {"name": "jdoe"},
+        {"name": "jroe", "token": "tokens/jroe.json", "logbook": "logbooks/jroe.xlsx", "workers": 2}
+    ]
+
+Só "name" é obrigatório. Os caminhos relativos são relativos à pasta do roster.
+"""
+import os
+import re
+import json
+
+# Nomes aceites: entram nos nomes das coleções e dos ficheiros
+TENANT_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Pilotos processados ao mesmo tempo
+TENANT_WORKERS = 4
+
+# Downloads em paralelo dentro da caixa de correio de cada piloto
+MAILBOX_WORKERS = 4
+
+class Tenant:
+    """Piloto do roster e os seus ficheiros."""
+
+    def __init__(self, name, token_path, logbook_path, parse_cache_path, workers=MAILBOX_WORKERS):
+        self.name = name
+        self.token_path = token_path
+        self.logbook_path = logbook_path
+        self.parse_cache_path = parse_cache_path
+        self.workers = workers
+
+    def __repr__(self):
+        return f"Tenant({self.name!r})"
+
+def load_roster(path):
+    """Ler o roster JSON dado. Por omissão cada piloto usa token_<nome>.json, logbook_<nome>.xlsx
+    e parse_cache_<nome>.sqlite na pasta do roster."""
+    with open(path) as file:
+        entries = json.load(file)
+    base_path = os.path.dirname(os.path.abspath(path))
+
+    def resolve(entry, key, default):
+        return os.path.join(base_path, entry.get(key) or default)
+
+    tenants = []
+    for entry in entries:
+        name = entry.get('name', '')
+        if not TENANT_NAME.match(name):
+            raise ValueError(f"Nome de piloto inválido no roster: {name!r}")
+        if any(tenant.name == name for tenant in tenants):
+            raise ValueError(f"Piloto repetido no roster: {name}")
+        tenants.append(Tenant(
+            name,
+            resolve(entry, 'token', f"token_{name}.json"),
+            resolve(entry, 'logbook', f"logbook_{name}.xlsx"),
+            resolve(entry, 'parse_cache', f"parse_cache_{name}.sqlite"),
+            int(entry.get('workers') or MAILBOX_WORKERS),
+        ))
+    return tenants
+
+def find_tenant(tenants, name):
+    for tenant in tenants:
+        if tenant.name == name:
+            return tenant
+    raise ValueError(f"Piloto {name} não está no roster")